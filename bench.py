@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark of the resolution pipeline on synthetic projects.
+
+Generates Java project trees and a race report of configurable size, then
+times each stage from a cold start and reports the timings and peak memory
+as JSON, e.g.:
+
+    python3 bench.py --projects 20 --files 500 --depth 200 --output bench.json
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tomllib
+import tracemalloc
+from contextlib import redirect_stderr
+from typing import Callable, Dict, List, Tuple
+
+import file_index
+import gitmeta
+import gitsource
+import main
+import package_index
+import projects
+import snippet_cache
+import source_roots
+import sources
+from frames import parse_frames
+from records import write_ndjson
+from ts import get_code_snippet
+
+PACKAGE_WORDS = ('core', 'util', 'internal', 'impl', 'api', 'io', 'net', 'concurrent', 'codec', 'spi')
+
+# Comments in several scripts, so snippet extraction sees multi-byte characters
+NON_ASCII_COMMENTS = ('Größenprüfung für Übergänge', '计算缓冲区大小', 'Проверка границ', 'café – naïve “quotes”')
+
+def java_source(package: str, class_name: str, methods: int, rng: random.Random) -> Tuple[str, List[Tuple[str, int]]]:
+    """
+    Returns the source of a synthetic class and, for each method, its name
+    and a line inside its body.
+    """
+    lines = [f'package {package};', '', 'import java.util.List;', '',
+             '/**', f' * {rng.choice(NON_ASCII_COMMENTS)}', ' */',
+             f'public class {class_name} {{', f'    private int size;', '']
+    method_lines = []
+    for i in range(methods):
+        name = f'method{i}'
+        lines += ['    /**', f'     * {rng.choice(NON_ASCII_COMMENTS)}', '     */',
+                  f'    public int {name}(List<String> values) {{',
+                  f'        int total = {i};']
+        method_lines.append((name, len(lines) + 1))
+        lines += ['        for (String value : values) {',
+                  f'            total += value.length(); // {rng.choice(NON_ASCII_COMMENTS)}',
+                  '        }',
+                  '        return total;',
+                  '    }', '']
+    lines.append('}')
+    return '\n'.join(lines) + '\n', method_lines
+
+def generate_projects(root: str, project_count: int, files_per_project: int, package_depth: int,
+                      methods_per_file: int, large_file_methods: int, seed: int) -> List[Tuple[str, str, int]]:
+    """
+    Writes the synthetic projects under root.
+
+    Returns:
+        List[Tuple[str, str, int]]: The qualified name of every method with
+        its file name and a line inside it, usable as stack frames.
+    """
+    rng = random.Random(seed)
+    frames = []
+    for p in range(project_count):
+        project = f'proj{p}'
+        for f in range(files_per_project):
+            segments = ['io', project] + [rng.choice(PACKAGE_WORDS) for _ in range(package_depth)]
+            package = '.'.join(segments)
+            class_name = f'Class{f}'
+            # Every fiftieth file is large, as generated or vendored sources tend to be
+            methods = large_file_methods if f % 50 == 49 else methods_per_file
+            source, method_lines = java_source(package, class_name, methods, rng)
+            # Some test sources mirror main ones, giving ambiguous suffix matches
+            source_sets = ('main', 'test') if f % 10 == 9 else ('main',)
+            for source_set in source_sets:
+                directory = os.path.join(root, project, 'src', source_set, 'java', *segments)
+                os.makedirs(directory, exist_ok=True)
+                with open(os.path.join(directory, f'{class_name}.java'), 'w', encoding='utf-8') as out:
+                    out.write(source)
+            for method, line in method_lines:
+                frames.append((f'{package}.{class_name}.{method}', f'{class_name}.java', line))
+    return frames
+
+def generate_report_input(frames: List[Tuple[str, str, int]], depth: int, seed: int) -> str:
+    """Returns an input TOML whose two stacks are depth frames deep each"""
+    rng = random.Random(seed)
+    stacks = []
+    for _ in range(2):
+        stack = [f'{name}({filename}:{line}))' for name, filename, line in rng.choices(frames, k=depth)]
+        # Real traces bottom out in JDK frames that resolve to no project
+        stack.append('java.lang.Thread.run(Thread.java:750))')
+        stacks.append(stack)
+    stack_trace = '\n'.join(['==================Stack Trace=================='] + stacks[0]
+                            + ['\t' + line for line in stacks[1]])
+    return (
+        'originating_test = "io.proj0.BenchTest#race"\n'
+        'algorithm = "bench"\n'
+        'field_declaration = """\nprivate int size;\n"""\n'
+        f'stack_trace = """\n{stack_trace}\n"""\n'
+    )
+
+def generate_frame_buffer(frames: List[Tuple[str, str, int]], count: int, seed: int) -> str:
+    """
+    Returns count stack trace lines in the formats found in logs: plain,
+    with 'at' and RV-Predict markers, JDK 9+ class loader and module
+    prefixes, native and unknown sources.
+    """
+    rng = random.Random(seed)
+    formats = (
+        '{name}({filename}:{line})',
+        '\tat {name}({filename}:{line})',
+        '  > at {name}({filename}:{line})',
+        '\tat app//{name}({filename}:{line})',
+        '\tat java.base/java.lang.Thread.run(Thread.java:829)',
+        '\tat lib@1.2/{name}({filename}:{line})',
+        '\tat java.base/jdk.internal.misc.Unsafe.park(Native Method)',
+        '\tat {name}(Unknown Source)',
+    )
+    lines = []
+    for _ in range(count):
+        name, filename, line = rng.choice(frames)
+        lines.append(rng.choice(formats).format(name=name, filename=filename, line=line))
+    return '\n'.join(lines) + '\n'
+
+def reset_caches(projects_root: str) -> None:
+    """Drops every in-memory and on-disk cache, so the next stage starts cold"""
+    for module in (sources, file_index, source_roots, package_index, projects, gitsource, gitmeta, snippet_cache):
+        module.clear_caches()
+    main.clear_located_sources()
+    main.get_project_details.cache_clear()
+    shutil.rmtree(file_index.get_root_index_dir(projects_root), ignore_errors=True)
+
+def measure(stage: Callable[[], None], prepare: Callable[[], None], repeat: int) -> Dict[str, float]:
+    """
+    Runs a stage repeat times after prepare, keeping the fastest run, then
+    once more under tracemalloc for its peak memory. Timings are taken with
+    tracemalloc off as it slows allocation-heavy code down severalfold.
+    """
+    timings = []
+    for _ in range(repeat):
+        prepare()
+        gc.collect()
+        start = time.perf_counter()
+        stage()
+        timings.append(time.perf_counter() - start)
+    prepare()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        stage()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': round(min(timings), 6), 'peak_bytes': peak}
+
+def measure_command(argv: List[str], repeat: int) -> Dict[str, float]:
+    """Runs a command repeat times, keeping the fastest wall time, startup of the interpreter included"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(argv, cwd=os.path.dirname(os.path.abspath(__file__)), check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return {'seconds': round(min(timings), 6)}
+
+def run_benchmark(args: argparse.Namespace, work_dir: str) -> dict:
+    projects_root = os.path.join(work_dir, 'projects')
+    start = time.perf_counter()
+    frames = generate_projects(projects_root, args.projects, args.files, args.package_depth,
+                               args.methods, args.large_file_methods, args.seed)
+    generate_seconds = time.perf_counter() - start
+    input_file = os.path.join(work_dir, 'input.toml')
+    with open(input_file, 'w', encoding='utf-8') as out:
+        out.write(generate_report_input(frames, args.depth, args.seed))
+    output_file = os.path.join(work_dir, 'report.html')
+
+    with open(input_file, 'rb') as f:
+        data = tomllib.load(f)
+    fst, snd = main.extract_stack_trace(data['stack_trace'])
+    trace_lines = [text for text, _data, _error in parse_frames(fst + '\n' + snd)]
+    parsed = [line_data for _text, line_data, _error in parse_frames(fst + '\n' + snd) if line_data is not None]
+    frame_buffer = generate_frame_buffer(frames, args.parse_frames, args.seed)
+    located = []
+
+    def cold() -> None:
+        reset_caches(projects_root)
+
+    def warm_index() -> None:
+        reset_caches(projects_root)
+        for line_data in parsed:
+            main.process_line(projects_root, line_data)
+        sources.clear_caches()
+
+    def parse_buffer() -> None:
+        for _frame in parse_frames(frame_buffer):
+            pass
+
+    def find_files() -> None:
+        for line_data in parsed:
+            project = main.find_most_likely_project(line_data.package,
+                                                    projects.get_project_directories(projects_root), None)
+            if project:
+                main.find_file_by_suffix(os.path.join(projects_root, project), line_data.expected_suffix)
+
+    def process_lines() -> None:
+        located.clear()
+        for line_data in parsed:
+            result, _error = main.process_line(projects_root, line_data)
+            if result is not None:
+                located.append(result)
+
+    def extract_snippets() -> None:
+        for line_data in located:
+            get_code_snippet(line_data.filepath, line_data.line_num)
+
+    def report(compact: bool = False) -> Callable[[], None]:
+        options = main.RenderOptions(compact=compact, snippet_cache=False,
+                                     assets_dir=os.path.join(work_dir, 'assets'))
+        return lambda: main.generate_report(projects_root, input_file, output_file, options=options)
+
+    def report_records() -> None:
+        write_ndjson(main.iter_report_records(data, projects_root, snippet_cache=False), io.StringIO())
+
+    stages = {
+        'parse_frames': measure(parse_buffer, lambda: None, args.repeat),
+        'find_file_by_suffix_cold': measure(find_files, cold, args.repeat),
+        'find_file_by_suffix_warm': measure(find_files, lambda: None, args.repeat),
+        'process_line': measure(process_lines, warm_index, args.repeat),
+        'get_code_snippet': measure(extract_snippets, sources.clear_caches, args.repeat),
+        'ndjson_records': measure(report_records, cold, args.repeat),
+        'html_report_cold': measure(report(), cold, args.repeat),
+        'html_report_warm': measure(report(), lambda: None, args.repeat),
+        'html_report_compact': measure(report(compact=True), cold, args.repeat),
+    }
+    # Whole CLI runs, where importing and loading the parser count as much as resolving
+    cli = [sys.executable, 'main.py', projects_root, input_file]
+    stages['startup_import_main'] = measure_command([sys.executable, '-c', 'import main'], args.repeat)
+    stages['cli_resolve_only'] = measure_command(cli + [os.path.join(work_dir, 'report.tsv'), '--resolve-only'],
+                                                 args.repeat)
+    stages['cli_html'] = measure_command(cli + [output_file, '--no-snippet-cache'], args.repeat)
+    stages['parse_frames']['frames_per_second'] = round(args.parse_frames / stages['parse_frames']['seconds'])
+    source_files = sum(len(files) for _root, _dirs, files in os.walk(projects_root))
+    return {
+        'python': sys.version.split()[0],
+        'config': {
+            'projects': args.projects,
+            'files_per_project': args.files,
+            'package_depth': args.package_depth,
+            'methods_per_file': args.methods,
+            'large_file_methods': args.large_file_methods,
+            'depth': args.depth,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'parse_frames': args.parse_frames,
+        },
+        'counts': {
+            'source_files': source_files,
+            'source_bytes': sum(os.path.getsize(os.path.join(root, name))
+                                for root, _dirs, files in os.walk(projects_root) for name in files),
+            'frames': len(trace_lines),
+            'located_frames': len(located),
+        },
+        'generate_seconds': round(generate_seconds, 6),
+        'stages': stages,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Benchmark the resolution pipeline on synthetic projects',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('--projects', type=int, default=10, help='Number of synthetic projects')
+    parser.add_argument('--files', type=int, default=200, help='Java files per project')
+    parser.add_argument('--package-depth', type=int, default=6, help='Package segments below io.<project>')
+    parser.add_argument('--methods', type=int, default=10, help='Methods per regular file')
+    parser.add_argument('--large-file-methods', type=int, default=2000, help='Methods in every fiftieth file')
+    parser.add_argument('--depth', type=int, default=100, help='Frames in each of the two stacks')
+    parser.add_argument('--seed', type=int, default=1, help='Seed for the generated trees and traces')
+    parser.add_argument('--parse-frames', type=int, default=200000, help='Stack trace lines in the parser benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per stage, the fastest is reported')
+    parser.add_argument('--work-dir', help='Generate the projects here and keep them, instead of a temporary directory')
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout')
+    parser.add_argument('--verbose', action='store_true', help='Show the messages printed while resolving frames')
+    args = parser.parse_args()
+
+    # Unresolvable JDK frames are reported on every run, which would drown the results
+    with redirect_stderr(sys.stderr if args.verbose else io.StringIO()):
+        if args.work_dir:
+            os.makedirs(args.work_dir, exist_ok=True)
+            results = run_benchmark(args, os.path.abspath(args.work_dir))
+        else:
+            with tempfile.TemporaryDirectory(prefix='stacktrace-bench-') as work_dir:
+                results = run_benchmark(args, work_dir)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as out:
+            out.write(text + '\n')
+    else:
+        print(text)
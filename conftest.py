@@ -0,0 +1,12 @@
+import os
+import pytest
+
+def write_file(path, text='class A {}\n'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+
+@pytest.fixture
+def make_file():
+    """Writes a file, creating its directories; the text defaults to a minimal class"""
+    return write_file
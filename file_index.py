@@ -0,0 +1,257 @@
+import os
+import sys
+import json
+import fnmatch
+import contextlib
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from gitmeta import read_head_commit
+from instrument import count, timed
+from source_roots import clear_source_roots, get_source_roots
+
+INDEX_VERSION = 1
+
+# Directory names never searched for sources: VCS metadata, build outputs and
+# dependency caches. Directories inside a project's source roots are always
+# searched, so packages named like these are still found.
+DEFAULT_IGNORE_GLOBS = ('.git', '.hg', '.svn', 'target', 'build', 'out', 'node_modules', '.gradle', '.idea', '.mvn')
+_IGNORE_GLOBS: Tuple[str, ...] = DEFAULT_IGNORE_GLOBS
+
+# In-process cache of loaded indexes, keyed by absolute project root
+_INDEXES: Dict[str, 'FileIndex'] = {}
+
+@dataclass
+class FileIndex:
+    project_root: str
+    fingerprint: dict
+    # filename -> paths relative to project_root, in os.walk order
+    files: Dict[str, List[str]]
+    fresh: bool = False
+    _suffix_cache: Dict[str, List[str]] = field(default_factory=dict, repr=False)
+
+    def find(self, expected_suffix: str) -> List[str]:
+        """
+        Returns the absolute paths of all indexed files ending with expected_suffix.
+
+        Args:
+            expected_suffix (str): Path suffix such as 'io/netty/util/Foo.java'.
+
+        Returns:
+            List[str]: Matching file paths, in the order os.walk visited them.
+        """
+        normalized_suffix = expected_suffix.replace(os.sep, '/')
+        cached = self._suffix_cache.get(normalized_suffix)
+        if cached is not None:
+            return cached
+        filename = normalized_suffix.rsplit('/', 1)[-1]
+        matches = [
+            os.path.join(self.project_root, rel_path)
+            for rel_path in self.files.get(filename, ())
+            if rel_path == normalized_suffix or rel_path.endswith('/' + normalized_suffix)
+        ]
+        self._suffix_cache[normalized_suffix] = matches
+        return matches
+
+def get_index_dir(project_root: str) -> str:
+    """
+    Returns the directory holding the persisted indexes for the projects root
+    containing project_root.
+    """
+    return get_root_index_dir(os.path.dirname(os.path.abspath(project_root).rstrip(os.sep)))
+
+def get_root_index_dir(projects_root: str) -> str:
+    """
+    Returns the directory holding the persisted indexes for a projects root.
+    It is a hidden sibling of the projects root so that it never shows up as
+    a project itself.
+    """
+    projects_root = os.path.abspath(projects_root).rstrip(os.sep)
+    return os.path.join(os.path.dirname(projects_root), f'.{os.path.basename(projects_root)}-index')
+
+def get_index_path(project_root: str) -> str:
+    project_name = os.path.basename(os.path.abspath(project_root).rstrip(os.sep))
+    return os.path.join(get_index_dir(project_root), f'{project_name}.json')
+
+def set_ignore_globs(globs: Iterable[str]) -> None:
+    """Sets the directory name patterns skipped when walking projects"""
+    global _IGNORE_GLOBS
+    _IGNORE_GLOBS = tuple(globs)
+
+def get_ignore_globs() -> Tuple[str, ...]:
+    return _IGNORE_GLOBS
+
+def walk_project(project_root: str) -> Iterator[Tuple[str, str, List[str]]]:
+    """
+    Walks a project like os.walk, skipping directories matching the ignore
+    globs outside of its source roots.
+
+    Yields:
+        Tuple[str, str, List[str]]: The directory, its path relative to the
+        project with '/' separators ('' for the root), and its file names.
+    """
+    project_root = project_root.rstrip(os.sep)
+    source_roots = tuple(root.replace(os.sep, '/') + '/' for root in get_source_roots(project_root))
+    prefix_len = len(project_root) + 1
+    for root, dirs, filenames in os.walk(project_root):
+        rel_root = root[prefix_len:].replace(os.sep, '/')
+        if not (rel_root + '/').startswith(source_roots):
+            dirs[:] = [name for name in dirs
+                       if not any(fnmatch.fnmatch(name, pattern) for pattern in _IGNORE_GLOBS)]
+        yield root, rel_root, filenames
+
+def compute_fingerprint(project_root: str) -> dict:
+    """
+    Returns the state an index is validated against: the HEAD commit for git
+    checkouts, otherwise the mtime of every directory in the tree. The
+    ignore globs are included, as they change what the index contains.
+    """
+    head = read_head_commit(project_root)
+    if head:
+        return {'head': head, 'ignore': list(_IGNORE_GLOBS)}
+    return {'dirs': _directory_mtimes(project_root), 'ignore': list(_IGNORE_GLOBS)}
+
+def _directory_mtimes(project_root: str) -> Dict[str, int]:
+    mtimes = {}
+    for root, rel_root, _files in walk_project(project_root):
+        try:
+            mtimes[rel_root or '.'] = os.stat(root).st_mtime_ns
+        except OSError:
+            continue
+    return mtimes
+
+def _is_valid(project_root: str, fingerprint: dict) -> bool:
+    if fingerprint.get('ignore') != list(_IGNORE_GLOBS):
+        return False
+    if 'head' in fingerprint:
+        return read_head_commit(project_root) == fingerprint['head']
+    # Adding or removing a file changes its parent directory's mtime, so
+    # statting the directories is enough without listing their contents
+    for rel_dir, mtime in fingerprint.get('dirs', {}).items():
+        try:
+            if os.stat(os.path.join(project_root, rel_dir)).st_mtime_ns != mtime:
+                return False
+        except OSError:
+            return False
+    return read_head_commit(project_root) is None
+
+@timed('file_index.build')
+def build_file_index(project_root: str) -> FileIndex:
+    """Walk the project tree once and build a filename -> relative paths index"""
+    fingerprint = compute_fingerprint(project_root)
+    files: Dict[str, List[str]] = {}
+    for _root, rel_root, filenames in walk_project(project_root):
+        for filename in filenames:
+            rel_path = f'{rel_root}/{filename}' if rel_root else filename
+            files.setdefault(filename, []).append(rel_path)
+    return FileIndex(project_root=project_root, fingerprint=fingerprint, files=files, fresh=True)
+
+@timed('file_index.load')
+def load_file_index(project_root: str) -> Optional[FileIndex]:
+    """Load a persisted index for project_root, or None if missing or stale"""
+    try:
+        with open(get_index_path(project_root), 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get('version') != INDEX_VERSION or data.get('project_root') != project_root:
+        return None
+    if not _is_valid(project_root, data['fingerprint']):
+        return None
+    return FileIndex(project_root=project_root, fingerprint=data['fingerprint'], files=data['files'])
+
+def write_text_atomic(path: str, text: str) -> None:
+    """
+    Writes text to path through a temporary file renamed over it, so that
+    concurrent readers, and other processes writing the same file, never see
+    it partially written. Missing parent directories are created.
+
+    Raises:
+        OSError: If the file cannot be written; no temporary file is left behind.
+    """
+    os.makedirs(os.path.dirname(path) or os.curdir, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except OSError:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+def write_json_atomic(path: str, data) -> None:
+    """Writes data to path as JSON, like write_text_atomic"""
+    write_text_atomic(path, json.dumps(data))
+
+def save_file_index(index: FileIndex) -> None:
+    index_path = get_index_path(index.project_root)
+    try:
+        write_json_atomic(index_path, {
+            'version': INDEX_VERSION,
+            'project_root': index.project_root,
+            'fingerprint': index.fingerprint,
+            'files': index.files,
+        })
+    except OSError as e:
+        print(f"Could not save file index to {index_path}: {e}", file=sys.stderr)
+
+def get_file_index(project_root: str, rebuild: bool = False) -> FileIndex:
+    """
+    Returns the file index for project_root, loading it from disk or building
+    it on first use. Indexes are kept in memory for the rest of the process.
+
+    Args:
+        project_root (str): The project directory.
+        rebuild (bool): Ignore any cached index and walk the tree again.
+
+    Returns:
+        FileIndex: The project's file index.
+    """
+    project_root = os.path.abspath(project_root)
+    index = None if rebuild else _INDEXES.get(project_root)
+    if index is None and not rebuild:
+        index = load_file_index(project_root)
+    if index is None:
+        count('file_index.built')
+        index = build_file_index(project_root)
+        save_file_index(index)
+    _INDEXES[project_root] = index
+    return index
+
+def find_indexed_files(project_root: str, expected_suffix: str) -> List[str]:
+    """
+    Look up files matching expected_suffix using the project's file index.
+
+    A miss on an index that was loaded from disk triggers one rebuild, in case
+    files were added without changing the fingerprint (e.g. uncommitted files
+    in a git checkout).
+    """
+    index = get_file_index(project_root)
+    matches = index.find(expected_suffix)
+    if not matches and not index.fresh:
+        matches = get_file_index(project_root, rebuild=True).find(expected_suffix)
+    return matches
+
+def invalidate_indexes(stale_only: bool = True) -> List[str]:
+    """
+    Drops in-memory indexes so that long-lived processes rebuild them on
+    next use.
+
+    Args:
+        stale_only (bool): Only drop indexes whose fingerprint no longer
+            matches their tree.
+
+    Returns:
+        List[str]: The project roots whose index was dropped.
+    """
+    dropped = [root for root, index in list(_INDEXES.items())
+               if not stale_only or not _is_valid(root, index.fingerprint)]
+    for root in dropped:
+        _INDEXES.pop(root, None)
+    # Modules may have been added or removed along with the files
+    clear_source_roots(None if not stale_only else dropped)
+    return dropped
+
+def clear_caches() -> None:
+    """Drops every index loaded by this process, leaving those saved on disk"""
+    _INDEXES.clear()
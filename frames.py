@@ -0,0 +1,109 @@
+import re
+from dataclasses import dataclass
+from typing import Iterator, Optional, Tuple
+
+@dataclass
+class LineData:
+    filename: str
+    filepath: str
+    package: str
+    method: str
+    line_num: int
+    expected_suffix: str
+    line_of_code: str
+    project_dir: str = ""
+
+# One stack trace line, in a single match: an optional 'at' with the '>'
+# or '---->' markers some tools print, the class loader and module prefixes
+# of JDK 9+ ('app//', 'java.base/', 'lib@1.2/', 'loader/lib@1.2/'), the
+# qualified method and its location. Prefixes cannot contain '$', unlike
+# lambda and hidden classes, whose names end in '/<address>' as in
+# 'io.demo.Foo$$Lambda$14/0x0000000800066840.run'; the address is part of the
+# qualified method and dropped from the class. Lines that are not frames only
+# match the last alternative, so that every line of a buffer is accounted for
+# in one pass. Each match takes its newline, so the next one starts at the next
+# line instead of the regex engine searching for it; quantifiers are
+# possessive as nothing they consume has to be given back.
+FRAME_PATTERN = re.compile(r'''
+    [ \t]*+(?:-*>+[ \t]*+)?(?:at[ \t]++)?
+    (?P<text>
+        (?:[^\s()/$]*+/){0,2}
+        (?P<qualified_method>[^\s()/]++(?:/(?:0x)?[0-9a-fA-F]++\.[^\s()/]++)?)
+        \((?P<file>[^:()\n]*+)(?::(?P<line>[^()\n]*+))?\)
+        [^\n]*+
+    |
+        [^\n]*+
+    )
+    \n?
+''', re.VERBOSE)
+
+# Locations of frames without source information
+UNKNOWN_SOURCES = frozenset(('Native Method', 'Unknown Source'))
+
+ParsedFrame = Tuple[str, Optional[LineData], Optional[str]]
+
+def frame_error(text: str) -> str:
+    """Returns why text is not a stack frame"""
+    if '(' not in text:
+        return f"Invalid line format: {text}"
+    method_part = text.split('(', 1)[0]
+    if '.' not in method_part:
+        return f"Invalid method format: {method_part}"
+    return f"Invalid file:line format in line: {text}"
+
+def frame_from_match(match: re.Match) -> ParsedFrame:
+    text, qualified_method, filename, line = match.groups()
+    text = text.rstrip()
+    if qualified_method is None:
+        return text, None, frame_error(text)
+    qualified, _, method = qualified_method.rpartition('.')
+    if not qualified or not method:
+        return text, None, frame_error(text)
+    if '/' in qualified:
+        # Drop the address of a lambda or hidden class
+        qualified = qualified.partition('/')[0]
+    if line is not None and line.isdigit():
+        line_num = int(line)
+    elif line is None or line == 'n/a' or filename in UNKNOWN_SOURCES:
+        # Unknown file or line number
+        line_num = -1
+    else:
+        return text, None, frame_error(text)
+    if filename in UNKNOWN_SOURCES:
+        # Guess the file from the top-level class, for the record only
+        filename = qualified.rpartition('.')[2].partition('$')[0] + '.java'
+    package_path = qualified.rpartition('.')[0].replace('.', '/')
+    return text, LineData(filename, "", qualified, method, line_num,
+                          f'{package_path}/{filename}' if package_path else filename, ""), None
+
+def parse_frame(line: str) -> ParsedFrame:
+    """
+    Parses a single stack trace line.
+
+    Returns:
+        Tuple[str, Optional[LineData], Optional[str]]: The line without its
+        'at' prefix and surrounding whitespace, then either the parsed frame
+        or the reason it is not one.
+    """
+    line = line.strip()
+    if not line:
+        return '', None, "Empty line"
+    if '\n' in line:
+        return line, None, frame_error(line)
+    return frame_from_match(FRAME_PATTERN.match(line))
+
+def parse_frames(buffer: str) -> Iterator[ParsedFrame]:
+    """
+    Parses every non-blank line of a buffer of stack trace lines in a single
+    pass, without splitting it into lines first.
+
+    Args:
+        buffer (str): Stack trace lines separated by newlines.
+
+    Returns:
+        Iterator[Tuple[str, Optional[LineData], Optional[str]]]: As parse_frame, for each non-blank line in order.
+    """
+    for match in FRAME_PATTERN.finditer(buffer):
+        parsed = frame_from_match(match)
+        if parsed[0]:
+            yield parsed
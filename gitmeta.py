@@ -0,0 +1,297 @@
+import os
+import sys
+import json
+import zlib
+import threading
+import subprocess
+from typing import Dict, List, Optional, Tuple
+from instrument import count, span, timed
+
+def find_git_dir(project_path: str) -> Optional[str]:
+    """
+    Returns the git directory of a checkout, following 'gitdir:' pointer files
+    used by worktrees and submodules.
+
+    Returns:
+        Optional[str]: The git directory, or None if project_path has no .git.
+    """
+    git_dir = os.path.join(project_path, '.git')
+    if os.path.isdir(git_dir):
+        return git_dir
+    try:
+        with open(git_dir, 'r') as f:
+            pointer = f.read().strip()
+    except OSError:
+        return None
+    if not pointer.startswith('gitdir:'):
+        return None
+    return os.path.normpath(os.path.join(project_path, pointer.removeprefix('gitdir:').strip()))
+
+def get_common_dir(git_dir: str) -> str:
+    """Returns the directory holding refs, config and objects shared by all worktrees"""
+    try:
+        with open(os.path.join(git_dir, 'commondir'), 'r') as f:
+            return os.path.normpath(os.path.join(git_dir, f.read().strip()))
+    except OSError:
+        return git_dir
+
+def read_packed_refs(common_dir: str) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Parses packed-refs.
+
+    Returns:
+        Tuple[Dict[str, str], Dict[str, str]]: ref -> object id, and ref ->
+        peeled commit id for annotated tags.
+    """
+    refs: Dict[str, str] = {}
+    peeled: Dict[str, str] = {}
+    try:
+        with open(os.path.join(common_dir, 'packed-refs'), 'r') as f:
+            last_ref = None
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                if line.startswith('^'):
+                    if last_ref:
+                        peeled[last_ref] = line[1:]
+                    continue
+                parts = line.split(' ', 1)
+                if len(parts) == 2:
+                    refs[parts[1]] = parts[0]
+                    last_ref = parts[1]
+    except OSError:
+        pass
+    return refs, peeled
+
+def resolve_ref(git_dir: str, ref: str) -> Optional[str]:
+    common_dir = get_common_dir(git_dir)
+    # Per-worktree refs live in the git dir, everything else in the common dir
+    for base in (git_dir, common_dir):
+        try:
+            with open(os.path.join(base, ref), 'r') as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.startswith('ref:'):
+            return resolve_ref(git_dir, value.removeprefix('ref:').strip())
+        return value
+    refs, _ = read_packed_refs(common_dir)
+    return refs.get(ref)
+
+def read_head(git_dir: str) -> Optional[str]:
+    """Returns the commit HEAD points to, or None if it cannot be resolved"""
+    return resolve_ref(git_dir, 'HEAD')
+
+def read_head_commit(project_path: str) -> Optional[str]:
+    git_dir = find_git_dir(project_path)
+    return read_head(git_dir) if git_dir else None
+
+def read_remote_url(git_dir: str, remote: str = 'origin') -> str:
+    """Reads remote.<remote>.url from the repository config"""
+    section = f'[remote "{remote}"]'
+    in_section = False
+    try:
+        with open(os.path.join(get_common_dir(git_dir), 'config'), 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('['):
+                    in_section = line == section
+                elif in_section and '=' in line:
+                    key, value = line.split('=', 1)
+                    if key.strip().lower() == 'url':
+                        return value.strip()
+    except OSError:
+        pass
+    return ''
+
+def peel_loose_object(common_dir: str, object_id: str) -> Optional[str]:
+    """
+    Returns the commit an object id refers to by inflating loose objects:
+    commits peel to themselves, annotated tags to their target. Returns None
+    if the object is packed and cannot be read without git.
+    """
+    path = os.path.join(common_dir, 'objects', object_id[:2], object_id[2:])
+    try:
+        with open(path, 'rb') as f:
+            data = zlib.decompress(f.read())
+    except (OSError, zlib.error):
+        return None
+    header, _, body = data.partition(b'\0')
+    if header.startswith(b'commit '):
+        return object_id
+    if header.startswith(b'tag ') and body.startswith(b'object '):
+        target = body[7:47].decode('ascii')
+        return peel_loose_object(common_dir, target)
+    return None
+
+def list_tags(git_dir: str) -> Dict[str, Tuple[str, Optional[str]]]:
+    """
+    Returns every tag with the object id it stores and the commit it points
+    to. The commit is None when the object is packed and could not be peeled
+    by reading .git directly.
+    """
+    common_dir = get_common_dir(git_dir)
+    refs, peeled = read_packed_refs(common_dir)
+    tags: Dict[str, Tuple[str, Optional[str]]] = {}
+    for ref, object_id in refs.items():
+        if ref.startswith('refs/tags/'):
+            tags[ref.removeprefix('refs/tags/')] = (object_id, peeled.get(ref, object_id))
+    tags_dir = os.path.join(common_dir, 'refs', 'tags')
+    for root, _dirs, files in os.walk(tags_dir):
+        for filename in files:
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, tags_dir).replace(os.sep, '/')
+            try:
+                with open(path, 'r') as f:
+                    object_id = f.read().strip()
+            except OSError:
+                continue
+            # Loose refs take precedence over packed ones
+            tags[name] = (object_id, peel_loose_object(common_dir, object_id))
+    return tags
+
+def get_tags_stamp(git_dir: str) -> List[int]:
+    """Returns mtimes that change whenever tags are added, removed or packed"""
+    common_dir = get_common_dir(git_dir)
+    stamp = []
+    for path in (os.path.join(common_dir, 'packed-refs'), os.path.join(common_dir, 'refs', 'tags')):
+        try:
+            stamp.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            stamp.append(0)
+    return stamp
+
+def run_git_command(project_path: str, command: List[str]) -> str:
+    count('git.subprocess')
+    try:
+        with span('git.subprocess'):
+            result = subprocess.run(
+                command,
+                cwd=project_path,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                check=True
+            )
+        return result.stdout.strip()
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"Error executing Git command: {getattr(e, 'stderr', None) or e}", file=sys.stderr)
+        return ""
+
+def describe_head(project_path: str, git_dir: str, commit: str) -> str:
+    """
+    Returns what 'git describe --tags' prints for commit, usually HEAD,
+    spawning git only when the answer cannot be read from the refs: when no
+    tag or more than one tag points at the commit, or when some tag could not
+    be peeled.
+    """
+    tags = list_tags(git_dir)
+    if not tags:
+        # 'git describe' would fail with "No names found"
+        return ''
+    exact = [name for name, (object_id, target) in tags.items() if commit in (object_id, target)]
+    unknown = any(target is None and object_id != commit for object_id, target in tags.values())
+    if len(exact) == 1 and not unknown:
+        return exact[0]
+    return run_git_command(project_path, ["git", "describe", "--tags", commit])
+
+class DescribeCache:
+    """
+    On-disk cache of 'git describe' results keyed by project path, validated
+    by the HEAD commit and the tag refs' mtimes. Safe to use from threads.
+    """
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.dirty = False
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = {}
+        if path:
+            try:
+                with open(path, 'r') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+
+    def get(self, project_path: str, commit: str, stamp: List[int]) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(project_path)
+        if entry and entry['commit'] == commit and entry['stamp'] == stamp:
+            return entry['tags']
+        return None
+
+    def put(self, project_path: str, commit: str, stamp: List[int], tags: str) -> None:
+        with self._lock:
+            self._entries[project_path] = {'commit': commit, 'stamp': stamp, 'tags': tags}
+            self.dirty = True
+
+    def save(self) -> None:
+        if not self.path or not self.dirty:
+            return
+        # Imported here as file_index depends on this module
+        from file_index import write_json_atomic
+        with self._lock:
+            entries = dict(self._entries)
+            self.dirty = False
+        try:
+            write_json_atomic(self.path, entries)
+        except OSError as e:
+            print(f"Could not save git metadata cache to {self.path}: {e}", file=sys.stderr)
+
+_DESCRIBE_CACHES: Dict[str, DescribeCache] = {}
+_DESCRIBE_CACHES_LOCK = threading.Lock()
+
+def get_describe_cache(path: str) -> DescribeCache:
+    """Returns the process-wide DescribeCache stored at path, loading it on first use"""
+    with _DESCRIBE_CACHES_LOCK:
+        cache = _DESCRIBE_CACHES.get(path)
+        if cache is None:
+            cache = _DESCRIBE_CACHES[path] = DescribeCache(path)
+        return cache
+
+def save_describe_caches() -> None:
+    for cache in list(_DESCRIBE_CACHES.values()):
+        cache.save()
+
+def clear_caches() -> None:
+    """Drops the describe caches loaded by this process, without saving them"""
+    with _DESCRIBE_CACHES_LOCK:
+        _DESCRIBE_CACHES.clear()
+
+@timed('git_metadata')
+def read_git_metadata(project_path: str, cache: Optional[DescribeCache] = None,
+                      commit: Optional[str] = None) -> Tuple[str, str, str]:
+    """
+    Collects the remote URL, 'git describe --tags' output and HEAD commit of
+    a checkout, reading .git directly where possible.
+
+    Args:
+        project_path (str): The project directory.
+        cache (DescribeCache, optional): Cache of describe results across runs.
+        commit (str, optional): Describe this commit instead of HEAD.
+
+    Returns:
+        Tuple[str, str, str]: The repository URL, tags and commit.
+    """
+    git_dir = find_git_dir(project_path)
+    if commit is not None:
+        # The cache only remembers HEAD, other commits are described each time
+        if git_dir is None:
+            return '', run_git_command(project_path, ["git", "describe", "--tags", commit]), commit
+        return read_remote_url(git_dir), describe_head(project_path, git_dir, commit), commit
+    commit = read_head(git_dir) if git_dir else None
+    if git_dir is None or commit is None:
+        # Not a plain checkout (e.g. nested in a parent repository), ask git
+        return (
+            run_git_command(project_path, ["git", "config", "--get", "remote.origin.url"]),
+            run_git_command(project_path, ["git", "describe", "--tags"]),
+            run_git_command(project_path, ["git", "rev-parse", "HEAD"]),
+        )
+    repo_url = read_remote_url(git_dir)
+    stamp = get_tags_stamp(git_dir)
+    tags = cache.get(project_path, commit, stamp) if cache else None
+    if tags is None:
+        tags = describe_head(project_path, git_dir, commit)
+        if cache:
+            cache.put(project_path, commit, stamp, tags)
+    return repo_url, tags, commit
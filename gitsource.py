@@ -0,0 +1,280 @@
+import os
+import re
+import sys
+import json
+import atexit
+import threading
+import subprocess
+from dataclasses import dataclass, field
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from file_index import FileIndex, get_index_dir, write_json_atomic
+from gitmeta import find_git_dir, get_common_dir
+from instrument import count, span, timed
+
+GIT_TREE_VERSION = 1
+
+# Sources read at a commit are addressed as '<project root>@<commit>/<path>',
+# so they flow through the pipeline like files and show up in reports with
+# the commit they were read at
+REVISION_PATH_PATTERN = re.compile(r'^(?P<root>.+)@(?P<commit>[0-9a-f]{40})(?:[/\\](?P<path>.*))?$')
+
+# Requests to 'git cat-file --batch' are newline-separated, so a spec with a
+# newline would send two of them and put every later read out of step
+INVALID_SPEC_PATTERN = re.compile(r'[\s\x00-\x1f\x7f]')
+
+class GitSourceError(OSError):
+    """Raised when sources cannot be read from a repository"""
+
+class Pin(NamedTuple):
+    """A project read at a commit, or why its revision could not be resolved"""
+    project: str
+    commit: str
+    error: Optional[str] = None
+
+# Pins sorted by project, so that they can key caches
+Revisions = Tuple[Pin, ...]
+
+@dataclass
+class GitTree(FileIndex):
+    """The files of a project at a commit, found by suffix like those of a file index"""
+    # path relative to the project -> blob id
+    blobs: Dict[str, str] = field(default_factory=dict)
+
+def check_spec(spec: str) -> None:
+    """Raises GitSourceError unless spec can be sent to 'git cat-file --batch' as a single request"""
+    if not spec or INVALID_SPEC_PATTERN.search(spec):
+        raise GitSourceError(f"Invalid revision {spec!r}")
+
+class CatFile:
+    """
+    A long-lived 'git cat-file --batch' process of one repository, serving
+    objects by id or revision expression without spawning git per object.
+    Safe to use from threads; requests are serialized.
+    """
+    def __init__(self, git_dir: str):
+        self.git_dir = git_dir
+        self._lock = threading.Lock()
+        self._process: Optional[subprocess.Popen] = None
+
+    def _start(self) -> subprocess.Popen:
+        if self._process is None or self._process.poll() is not None:
+            count('git.cat_file.start')
+            try:
+                self._process = subprocess.Popen(
+                    ['git', '--git-dir', self.git_dir, 'cat-file', '--batch'],
+                    stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            except OSError as e:
+                raise GitSourceError(f"Could not start git cat-file in {self.git_dir}: {e}") from e
+        return self._process
+
+    @timed('git.cat_file')
+    def read(self, spec: str) -> Optional[Tuple[str, str, bytes]]:
+        """
+        Returns the id, type and contents of an object, or None if it does
+        not exist.
+
+        Args:
+            spec (str): An object id or any revision expression, e.g. 'v1.0^{tree}'.
+
+        Raises:
+            GitSourceError: If spec has whitespace or control characters, or
+                the repository cannot be read.
+        """
+        check_spec(spec)
+        with self._lock:
+            process = self._start()
+            try:
+                process.stdin.write(spec.encode() + b'\n')
+                process.stdin.flush()
+                header = process.stdout.readline()
+                if not header:
+                    raise GitSourceError(f"git cat-file exited in {self.git_dir}")
+                fields = header.split()
+                if len(fields) != 3:
+                    # '<spec> missing' or '<spec> ambiguous'
+                    return None
+                object_id, object_type, size = fields
+                data = process.stdout.read(int(size))
+                process.stdout.read(1)
+            except (OSError, ValueError) as e:
+                process.kill()
+                raise GitSourceError(f"Could not read {spec} in {self.git_dir}: {e}") from e
+        count('git.cat_file.object')
+        return object_id.decode(), object_type.decode(), data
+
+    def close(self) -> None:
+        with self._lock:
+            if self._process is not None and self._process.poll() is None:
+                self._process.stdin.close()
+                self._process.wait()
+            self._process = None
+
+# Open cat-file processes keyed by process id and common git directory, as
+# pipes must not be shared with forked workers
+_CAT_FILES: Dict[Tuple[int, str], CatFile] = {}
+# Listings of commits, which never change, keyed by project root and commit
+_TREES: Dict[Tuple[str, str], GitTree] = {}
+_LOCK = threading.Lock()
+
+def get_cat_file(project_root: str) -> CatFile:
+    """Returns this process' cat-file process for the repository of a project"""
+    git_dir = find_git_dir(project_root)
+    if git_dir is None:
+        raise GitSourceError(f"Not a git repository: {project_root}")
+    key = (os.getpid(), get_common_dir(git_dir))
+    with _LOCK:
+        cat_file = _CAT_FILES.get(key)
+        if cat_file is None:
+            cat_file = _CAT_FILES[key] = CatFile(key[1])
+        return cat_file
+
+@atexit.register
+def close_cat_files() -> None:
+    with _LOCK:
+        cat_files = [cat_file for (pid, _), cat_file in _CAT_FILES.items() if pid == os.getpid()]
+    for cat_file in cat_files:
+        cat_file.close()
+
+def clear_caches() -> None:
+    """Stops this process' cat-file processes and drops the commit listings it loaded"""
+    close_cat_files()
+    with _LOCK:
+        _CAT_FILES.clear()
+        _TREES.clear()
+
+def resolve_commit(project_root: str, revision: str) -> str:
+    """Returns the commit id a revision (commit id, tag, branch, ...) of a project refers to"""
+    check_spec(revision)
+    result = get_cat_file(project_root).read(f'{revision}^{{commit}}')
+    if result is None:
+        raise GitSourceError(f"Unknown revision {revision} in {project_root}")
+    return result[0]
+
+def resolve_revisions(projects_root: str, commits: Dict[str, str]) -> Revisions:
+    """
+    Resolves the revision each project should be read at to a commit id.
+    A revision that cannot be resolved only fails the frames of its project,
+    which are reported with the error instead of being read from the working
+    tree.
+
+    Args:
+        projects_root (str): The absolute root directory of the projects.
+        commits (Dict[str, str]): Project directory -> revision.
+
+    Returns:
+        Revisions: The pins, sorted by project.
+    """
+    pins = []
+    for project, revision in sorted(commits.items()):
+        try:
+            pins.append(Pin(project, resolve_commit(os.path.join(projects_root, project), revision)))
+        except GitSourceError as e:
+            error = f"Error reading {project} at {revision}: {e}"
+            print(error, file=sys.stderr)
+            pins.append(Pin(project, '', error))
+    return tuple(pins)
+
+def find_pin(revisions: Optional[Revisions], project: str) -> Optional[Pin]:
+    """Returns the pin of a project, or None if it is read from its working tree"""
+    return next((pin for pin in revisions or () if pin.project == project), None)
+
+def get_revision_path(project_root: str, commit: str, rel_path: str = '') -> str:
+    root = f'{project_root.rstrip(os.sep)}@{commit}'
+    return os.path.join(root, rel_path) if rel_path else root
+
+def split_revision_path(path: str) -> Optional[Tuple[str, str, str]]:
+    """Returns the project root, commit and relative path of a path read at a commit, or None for other paths"""
+    match = REVISION_PATH_PATTERN.match(path) if '@' in path else None
+    if match is None:
+        return None
+    return match.group('root'), match.group('commit'), (match.group('path') or '').replace(os.sep, '/')
+
+def get_tree_path(project_root: str, commit: str) -> str:
+    project_name = os.path.basename(os.path.abspath(project_root).rstrip(os.sep))
+    return os.path.join(get_index_dir(project_root), f'{project_name}@{commit}.json')
+
+@timed('git.tree')
+def read_tree(cat_file: CatFile, commit: str) -> Dict[str, str]:
+    """Lists the files of a commit as path -> blob id, walking its tree objects"""
+    blobs: Dict[str, str] = {}
+    pending = [('', f'{commit}^{{tree}}')]
+    while pending:
+        prefix, spec = pending.pop()
+        result = cat_file.read(spec)
+        if result is None:
+            raise GitSourceError(f"Missing tree {spec} in {cat_file.git_dir}")
+        data = result[2]
+        position = 0
+        # Entries are '<mode> <name>\0' followed by the 20-byte object id
+        while position < len(data):
+            space = data.index(b' ', position)
+            nul = data.index(b'\0', space)
+            mode = data[position:space]
+            name = data[space + 1:nul].decode('utf-8', 'surrogateescape')
+            object_id = data[nul + 1:nul + 21].hex()
+            position = nul + 21
+            if mode == b'40000':
+                pending.append((f'{prefix}{name}/', object_id))
+            elif mode != b'160000':
+                # Submodules are not part of the repository
+                blobs[f'{prefix}{name}'] = object_id
+    return blobs
+
+def get_git_tree(project_root: str, commit: str) -> GitTree:
+    """
+    Returns the listing of a project at a commit, whose paths are read at
+    that commit. Listings are saved next to the file indexes and,
+    as commits never change, never rebuilt.
+    """
+    project_root = os.path.abspath(project_root)
+    key = (project_root, commit)
+    with _LOCK:
+        tree = _TREES.get(key)
+    if tree is not None:
+        return tree
+    tree_path = get_tree_path(project_root, commit)
+    blobs = None
+    try:
+        with open(tree_path, 'r') as f:
+            data = json.load(f)
+        if data.get('version') == GIT_TREE_VERSION:
+            blobs = data['blobs']
+    except (OSError, ValueError):
+        pass
+    if blobs is None:
+        count('git.tree.built')
+        blobs = read_tree(get_cat_file(project_root), commit)
+        try:
+            write_json_atomic(tree_path, {'version': GIT_TREE_VERSION, 'blobs': blobs})
+        except OSError as e:
+            print(f"Could not save git tree to {tree_path}: {e}", file=sys.stderr)
+    files: Dict[str, List[str]] = {}
+    for rel_path in blobs:
+        files.setdefault(rel_path.rsplit('/', 1)[-1], []).append(rel_path)
+    tree = GitTree(project_root=get_revision_path(project_root, commit), fingerprint={'commit': commit},
+                   files=files, fresh=True, blobs=blobs)
+    with _LOCK:
+        _TREES[key] = tree
+    return tree
+
+def find_revision_files(project_root: str, commit: str, expected_suffix: str) -> List[str]:
+    """Looks up the files of a project at a commit ending with expected_suffix"""
+    return get_git_tree(project_root, commit).find(expected_suffix)
+
+def read_revision_file(path: str) -> bytes:
+    """
+    Returns the contents of a path read at a commit.
+
+    Raises:
+        FileNotFoundError: If the commit has no such file.
+        GitSourceError: If the repository cannot be read.
+    """
+    project_root, commit, rel_path = split_revision_path(path)
+    blob_id = get_git_tree(project_root, commit).blobs.get(rel_path)
+    if blob_id is None:
+        raise FileNotFoundError(f"No {rel_path} at {commit} in {project_root}")
+    with span('read_source'):
+        result = get_cat_file(project_root).read(blob_id)
+    if result is None:
+        raise GitSourceError(f"Missing blob {blob_id} in {project_root}")
+    return result[2]
@@ -0,0 +1,168 @@
+import os
+import sys
+import glob
+import json
+import time
+import functools
+import threading
+import contextlib
+from typing import Callable, Dict, List, Optional, TextIO, Tuple
+
+# Profiling is off unless enable() is called, in which case span() and count()
+# cost a context manager and a dictionary update each
+_ENABLED = False
+_TRACE = False
+_LOCK = threading.Lock()
+# span name -> [calls, total ns, max ns]
+_STATS: Dict[str, List[int]] = {}
+_COUNTERS: Dict[str, int] = {}
+# (name, start ns, duration ns, pid, thread id), only kept when tracing
+_EVENTS: List[Tuple[str, int, int, int, int]] = []
+_SPOOL_DIR: Optional[str] = None
+_NULL_SPAN = contextlib.nullcontext()
+
+class _Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self) -> '_Span':
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        duration = time.perf_counter_ns() - self.start
+        with _LOCK:
+            stats = _STATS.get(self.name)
+            if stats is None:
+                stats = _STATS[self.name] = [0, 0, 0]
+            stats[0] += 1
+            stats[1] += duration
+            if duration > stats[2]:
+                stats[2] = duration
+            if _TRACE:
+                _EVENTS.append((self.name, self.start, duration, os.getpid(), threading.get_ident()))
+
+def enable(trace: bool = False, spool_dir: Optional[str] = None) -> None:
+    """
+    Starts collecting spans and counters in this process.
+
+    Args:
+        trace (bool): Also keep every span, for write_chrome_trace().
+        spool_dir (str, optional): Directory worker processes write their
+            measurements to when they exit, for merge_spool().
+    """
+    global _ENABLED, _TRACE, _SPOOL_DIR
+    _ENABLED, _TRACE, _SPOOL_DIR = True, trace, spool_dir
+
+def is_enabled() -> bool:
+    return _ENABLED
+
+def is_tracing() -> bool:
+    return _TRACE
+
+def get_spool_dir() -> Optional[str]:
+    return _SPOOL_DIR
+
+def span(name: str):
+    """Context manager timing the enclosed block under name"""
+    return _Span(name) if _ENABLED else _NULL_SPAN
+
+def timed(name: str) -> Callable:
+    """Decorator timing every call of a function under name"""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _ENABLED:
+                return func(*args, **kwargs)
+            with _Span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def count(name: str, n: int = 1) -> None:
+    """Adds n to a counter, e.g. cache hits"""
+    if _ENABLED:
+        with _LOCK:
+            _COUNTERS[name] = _COUNTERS.get(name, 0) + n
+
+def init_worker(trace: bool, spool_dir: str) -> None:
+    """Enables profiling in a pool worker, which spools its measurements to spool_dir when it exits"""
+    import multiprocessing.util
+    reset()
+    enable(trace, spool_dir)
+    # Pool workers leave through os._exit(), which skips atexit handlers but
+    # still runs multiprocessing finalizers
+    multiprocessing.util.Finalize(None, _spool, args=(spool_dir,), exitpriority=10)
+
+def _spool(spool_dir: str) -> None:
+    with _LOCK:
+        payload = {'stats': _STATS, 'counters': _COUNTERS, 'events': _EVENTS}
+        try:
+            with open(os.path.join(spool_dir, f'{os.getpid()}.json'), 'w') as f:
+                json.dump(payload, f)
+        except OSError as e:
+            print(f"Could not save profile of worker {os.getpid()}: {e}", file=sys.stderr)
+
+def merge_spool(spool_dir: str) -> None:
+    """Adds the measurements spooled by exited workers to this process' ones"""
+    for path in glob.glob(os.path.join(spool_dir, '*.json')):
+        try:
+            with open(path, 'r') as f:
+                payload = json.load(f)
+            os.remove(path)
+        except (OSError, ValueError):
+            continue
+        with _LOCK:
+            for name, (calls, total, longest) in payload['stats'].items():
+                stats = _STATS.setdefault(name, [0, 0, 0])
+                stats[0] += calls
+                stats[1] += total
+                stats[2] = max(stats[2], longest)
+            for name, value in payload['counters'].items():
+                _COUNTERS[name] = _COUNTERS.get(name, 0) + value
+            _EVENTS.extend(tuple(event) for event in payload['events'])
+
+def reset() -> None:
+    with _LOCK:
+        _STATS.clear()
+        _COUNTERS.clear()
+        _EVENTS.clear()
+
+def format_summary() -> str:
+    """Returns the spans, slowest first, and the counters as a text table"""
+    with _LOCK:
+        stats = sorted(_STATS.items(), key=lambda item: item[1][1], reverse=True)
+        counters = sorted(_COUNTERS.items())
+    name_width = max([len('Span')] + [len(name) for name, _ in stats] + [len(name) for name, _ in counters])
+    lines = [f'{"Span":<{name_width}}  {"Calls":>8}  {"Total ms":>10}  {"Mean ms":>9}  {"Max ms":>9}']
+    for name, (calls, total, longest) in stats:
+        lines.append(f'{name:<{name_width}}  {calls:>8}  {total / 1e6:>10.1f}  {total / calls / 1e6:>9.3f}  '
+                     f'{longest / 1e6:>9.3f}')
+    if counters:
+        lines.append('')
+        lines.append(f'{"Counter":<{name_width}}  {"Value":>8}')
+        for name, value in counters:
+            lines.append(f'{name:<{name_width}}  {value:>8}')
+    return '\n'.join(lines) + '\n'
+
+def print_summary(file: Optional[TextIO] = None) -> None:
+    (file or sys.stderr).write(format_summary())
+
+def write_chrome_trace(path: str) -> None:
+    """
+    Writes the recorded spans in the Chrome trace event format, viewable in
+    chrome://tracing or https://ui.perfetto.dev. Spans of worker processes
+    appear as separate processes.
+    """
+    with _LOCK:
+        events = list(_EVENTS)
+        counters = dict(_COUNTERS)
+    origin = min((event[1] for event in events), default=0)
+    trace_events = [
+        {'name': name, 'ph': 'X', 'ts': (start - origin) / 1000, 'dur': duration / 1000, 'pid': pid, 'tid': tid}
+        for name, start, duration, pid, tid in events
+    ]
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': trace_events, 'otherData': {'counters': counters}}, f)
@@ -1,28 +1,69 @@
 #!/usr/bin/env python3
 import argparse
+import contextlib
+import functools
+import glob
 import os
 import sys
-import re
 import html
 import tomllib
-import subprocess
-from typing import Tuple, List, Optional
+import sqlite3
+import shutil
+import tempfile
+import threading
+import weakref
+from concurrent.futures import Executor, ThreadPoolExecutor
+from collections import deque
+from itertools import groupby, repeat, zip_longest
+from typing import Dict, Iterator, Tuple, List, Optional, Set, TextIO
 from dataclasses import dataclass
-from ts import get_code_snippet
-from template import HEADER, TABLE_HEADER, FOOTER
+from ts import get_code_snippet, highlight_snippet, highlight_source
+from sources import SOURCE_CACHE, DEFAULT_SOURCE_CACHE_BYTES, read_source
+from file_index import (DEFAULT_IGNORE_GLOBS, find_indexed_files, get_ignore_globs, get_index_dir, get_root_index_dir,
+                        set_ignore_globs, write_text_atomic)
+from source_roots import probe_source_roots
+from package_index import find_declaring_files
+from gitsource import GitSourceError, Revisions, find_pin, find_revision_files, resolve_revisions, split_revision_path
+from snippet_cache import get_snippet_cache
+from instrument import timed
+import instrument
+from projects import PackageTrie, ProjectDirectories, compile_mapping, get_project_directories, match_project_name
+from frames import LineData, ParsedFrame, parse_frames
+from rvlog import Race, iter_races
+from records import frame_record, report_record, stream_records, write_ndjson
+from gitmeta import get_describe_cache, read_git_metadata, read_head_commit, save_describe_caches
+from template import HEADER, TABLE_HEADER, FOOTER, COMPACT_HEADER, COMPACT_STYLE
 
-ACCESSED_PROJECTS = set()
+# Stylesheets already written by this process for compact reports
+_WRITTEN_ASSETS: Set[str] = set()
+
+# Rendered in place of a class or method declaration that was not found
+MISSING_SNIPPET = {'start_line': None, 'content': 'None\n'}
+
+@dataclass
+class Frame:
+    line: str
+    data: Optional[LineData] = None
+    error: Optional[str] = None
 
 @dataclass
-class LineData:
-    filename: str
-    filepath: str
-    package: str
-    method: str
-    line_num: int
-    expected_suffix: str
-    line_of_code: str
-    project_dir: str = ""
+class RenderOptions:
+    # Link styles from a shared asset directory and highlight code offline
+    compact: bool = False
+    # Shared asset directory, defaults to 'assets' next to the output file
+    assets_dir: Optional[str] = None
+    # Lines kept around the frame line when folding method bodies in compact mode
+    fold_context: int = 8
+    # 'html', 'ndjson' for the records only, or 'both'
+    output_format: str = 'html'
+    # Reuse snippets extracted by earlier runs from the on-disk cache
+    snippet_cache: bool = True
+    # Extract snippets; without them only the resolved path and line of each
+    # frame are written, as tab-separated text instead of HTML
+    snippets: bool = True
+    # Project directory -> revision to read its sources at, over the report's
+    # own 'commits' table
+    commits: Optional[Dict[str, str]] = None
 
 @dataclass
 class Project:
@@ -31,163 +72,691 @@ class Project:
     tags: str
     commit: str
 
-def get_relative_path(root_path: str, filepath: str) -> str:
+def locate_parsed_frame(parsed: ParsedFrame, project_root: str, mapping: Optional[PackageTrie] = None,
+                        revisions: Optional[Revisions] = None) -> Optional[Frame]:
     """
-    Returns the relative path of filepath with respect to root_path.
+    Locates the source file and line of a stack trace line already parsed by
+    parse_frame or parse_frames, without extracting any code snippet.
 
     Args:
-        root_path (str): The root path.
-        filepath (str): The file path.
+        parsed (ParsedFrame): The parsed stack trace line.
+        project_root (str): The root directory of the projects.
+        mapping (PackageTrie, optional): The compiled package prefix to directory mapping.
+        revisions (Revisions, optional): Projects read at a commit instead of their working tree.
 
     Returns:
-        str: The relative path of filepath with respect to root_path.
-    """
-    relative_path = filepath.removeprefix(root_path)
-    return relative_path.lstrip(os.sep)
-
-def helper(lines: List[str], project_root: str, mapping: Optional[dict] = None) -> List[str]:
-    """Helper function to process each line of the input"""
-    result = []
-    for raw_line in lines:
-        # Parse line into components
-        line = preprocess_input(raw_line)
-        if line == '':
-            continue
-        data, error = parse_line(line)
-        if error:
-            print(error, file=sys.stderr)
-            result.append(output_error(line, error))
-            continue
-        if data.package.startswith('com.runtimeverification.rvpredict.runtime.RVPredictRuntime'):
-            print(f"Skipping line: {line}", file=sys.stderr)
-            continue
-        if data.line_num == -1:
-            result.append(output_unknown(line))
-            continue
-        processed_data, error = process_line(project_root, data, mapping)
-        if error:
-            print(error, file=sys.stderr)
-            result.append(output_error(line, error))
-            continue
-        relative_path = get_relative_path(project_root, processed_data.filepath)
-        ACCESSED_PROJECTS.add(processed_data.project_dir)
-        class_details, method_details = get_code_snippet(processed_data.filepath, processed_data.line_num)
-        result.append(output(processed_data, class_details, method_details, relative_path))
-    return result
+        Optional[Frame]: The located frame, or None if the line is skipped.
+    """
+    line, data, error = parsed
+    if error:
+        print(error, file=sys.stderr)
+        return Frame(line=line, error=error)
+    if data.package.startswith('com.runtimeverification.rvpredict.runtime.RVPredictRuntime'):
+        print(f"Skipping line: {line}", file=sys.stderr)
+        return None
+    if data.line_num == -1:
+        return Frame(line=line, data=data)
+    processed_data, error = locate_source(project_root, data.filename, data.package, data.method,
+                                          data.line_num, data.expected_suffix, mapping, revisions)
+    if error:
+        print(error, file=sys.stderr)
+        return Frame(line=line, error=error)
+    return Frame(line=line, data=processed_data)
+
+@functools.lru_cache(maxsize=4096)
+def locate_source(projects_root: str, filename: str, package: str, method: str, line_num: int,
+                  expected_suffix: str, mapping: Optional[PackageTrie] = None,
+                  revisions: Optional[Revisions] = None) -> Tuple[Optional[LineData], Optional[str]]:
+    """
+    Memoized process_line keyed by the frame's (package, method, file, line), so
+    frames repeated within or across reports are only resolved once. The
+    returned LineData is shared and must not be modified. The sources it was
+    resolved from are recorded for located_sources_changed.
+    """
+    data = LineData(
+        filename=filename,
+        filepath="",
+        package=package,
+        method=method,
+        line_num=line_num,
+        expected_suffix=expected_suffix,
+        line_of_code=""
+    )
+    located, error = process_line(projects_root, data, mapping, revisions)
+    if located is not None:
+        record_located_source(os.path.join(projects_root, located.project_dir), located.filepath)
+    else:
+        project = find_most_likely_project(package, get_project_directories(projects_root), mapping)
+        if project:
+            record_located_source(os.path.join(projects_root, project))
+    return located, error
+
+# What the lookups memoized by locate_source in this process were resolved
+# from: the HEAD commit of each project and the mtime of each file, so that
+# long-lived processes can tell when a checkout or an edit made them stale
+_LOCATED_HEADS: Dict[str, Optional[str]] = {}
+_LOCATED_MTIMES: Dict[str, Optional[int]] = {}
+_LOCATED_LOCK = threading.Lock()
+
+def get_mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def record_located_source(project_root: str, filepath: Optional[str] = None) -> None:
+    with _LOCATED_LOCK:
+        if project_root not in _LOCATED_HEADS:
+            _LOCATED_HEADS[project_root] = read_head_commit(project_root)
+        # Files read at a commit never change
+        if filepath and filepath not in _LOCATED_MTIMES and split_revision_path(filepath) is None:
+            _LOCATED_MTIMES[filepath] = get_mtime(filepath)
+
+def located_sources_changed() -> bool:
+    """Returns whether a project locate_source resolved into moved to another commit, or one of its files changed"""
+    with _LOCATED_LOCK:
+        heads = list(_LOCATED_HEADS.items())
+        mtimes = list(_LOCATED_MTIMES.items())
+    return (any(read_head_commit(project_root) != head for project_root, head in heads)
+            or any(get_mtime(path) != mtime for path, mtime in mtimes))
+
+def clear_located_sources() -> None:
+    """Drops the lookups memoized by locate_source, along with what they were resolved from"""
+    with _LOCATED_LOCK:
+        locate_source.cache_clear()
+        _LOCATED_HEADS.clear()
+        _LOCATED_MTIMES.clear()
+
+@timed('extract_snippets')
+def extract_snippets(frame: Frame, highlight: bool = False,
+                     cache_path: Optional[str] = None) -> Optional[Tuple[dict, dict]]:
+    """
+    Extracts the class and method snippets of a located frame, if it has any.
+    With highlight, each snippet also gets its source rows rendered as
+    highlighted HTML under 'lines'. With cache_path, snippets are looked up
+    in and added to the on-disk snippet cache stored there.
+    """
+    if frame.error or frame.data.line_num == -1:
+        return None
+    class_details, method_details = get_snippets(frame.data.filepath, frame.data.line_num, cache_path)
+    if highlight:
+        # Copies, as the snippets returned by get_code_snippet are shared
+        class_details = {**class_details, 'lines': highlight_snippet(frame.data.filepath, class_details)}
+        method_details = {**method_details, 'lines': highlight_snippet(frame.data.filepath, method_details)}
+    return class_details, method_details
+
+def get_snippets(filepath: str, line_num: int, cache_path: Optional[str] = None) -> Tuple[dict, dict]:
+    """Returns the class and method snippets around a line, parsing the file only on a cache miss"""
+    cache = get_snippet_cache(cache_path) if cache_path else None
+    if cache is None:
+        return get_code_snippet(filepath, line_num)
+    source = read_source(filepath)
+    # Repeated frames are answered from memory without querying the database
+    known = source.derived.setdefault('snippets', {})
+    snippets = known.get(line_num)
+    if snippets is not None:
+        return snippets
+    try:
+        snippets = cache.get(source.blob_id, line_num)
+    except sqlite3.Error as e:
+        print(f"Could not read snippet cache: {e}", file=sys.stderr)
+    if snippets is None:
+        snippets = get_code_snippet(filepath, line_num)
+        try:
+            cache.put(source.blob_id, line_num, snippets)
+        except sqlite3.Error as e:
+            print(f"Could not write snippet cache: {e}", file=sys.stderr)
+    known[line_num] = snippets
+    return snippets
+
+class CellRenderer:
+    """
+    Renders the HTML cells of one report. Each distinct class or method
+    snippet is emitted once; later cells showing the same snippet link back
+    to it, so the output grows with the number of unique frames.
+    """
+    def __init__(self, project_root: str, options: Optional[RenderOptions] = None):
+        self.project_root = project_root
+        self.options = options or RenderOptions()
+        self.snippet_ids: Dict[tuple, str] = {}
+
+    @timed('render')
+    def render(self, record: dict) -> str:
+        """Renders the cell of a frame record"""
+        if record['status'] == 'error':
+            return output_error(record['frame'], record['error'])
+        if record['status'] == 'unknown':
+            return output_unknown(record['frame'])
+        highlighted = record.get('highlighted', {})
+        return output(
+            record,
+            self.render_snippet('class', record['path'], record['class_span'], highlighted.get('class')),
+            self.render_snippet('method', record['path'], record['method_span'], highlighted.get('method'),
+                                record['line']),
+        )
+
+    def render_snippet(self, kind: str, relative_path: str, details: Optional[dict],
+                       lines: Optional[List[str]] = None, focus_line: Optional[int] = None) -> str:
+        if details is None:
+            return output_snippet(MISSING_SNIPPET)
+        folded = None
+        if lines is not None and focus_line is not None:
+            folded = fold_lines(details, lines, focus_line, self.options.fold_context)
+        # Highlighted code marks the frame line, and may be folded around it,
+        # so it is only shared between frames on the same line
+        key = (kind, relative_path, details['start_line'], focus_line if lines is not None else None)
+        snippet_id = self.snippet_ids.get(key)
+        if snippet_id is not None:
+            return output_snippet_ref(snippet_id, relative_path, details)
+        snippet_id = self.snippet_ids[key] = f'snippet-{len(self.snippet_ids) + 1}'
+        if lines is not None:
+            return output_code(details['start_line'], lines, folded, focus_line, snippet_id)
+        return output_snippet(details, snippet_id)
+
+def helper(stack: str, project_root: str, mapping: Optional[PackageTrie] = None,
+           executor: Optional[Executor] = None, revisions: Optional[Revisions] = None) -> List[Frame]:
+    """
+    Helper function to locate the frame on each line of a stack.
+
+    The stack is parsed in one pass, then frames are located independently,
+    in parallel with an executor. Results keep the input order. Located
+    frames are small; the expensive snippets are only produced later by
+    iter_snippets.
+    """
+    with instrument.span('parse_frames'):
+        parsed = list(parse_frames(stack))
+    if executor is not None:
+        frames = executor.map(locate_parsed_frame, parsed, repeat(project_root), repeat(mapping), repeat(revisions),
+                              chunksize=8)
+    else:
+        frames = (locate_parsed_frame(frame, project_root, mapping, revisions) for frame in parsed)
+    return [frame for frame in frames if frame is not None]
+
+def iter_snippets(frames: List[Frame], executor: Optional[Executor] = None, highlight: bool = False,
+                  cache_path: Optional[str] = None) -> Iterator[Optional[Tuple[dict, dict]]]:
+    """
+    Lazily extracts the snippets of each frame, in order. With an executor,
+    at most get_executor_window(executor) frames are being extracted at a
+    time, so the snippets in flight do not grow with the depth of the stack.
+    """
+    if executor is None:
+        yield from (extract_snippets(frame, highlight, cache_path) for frame in frames)
+        return
+    window = get_executor_window(executor)
+    pending = deque()
+    for frame in frames:
+        pending.append(executor.submit(extract_snippets, frame, highlight, cache_path))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def get_accessed_projects(frames: List[Frame]) -> Set[str]:
+    return {frame.data.project_dir for frame in frames if frame.data and frame.data.project_dir}
 
 def is_rv_format(input_str: str) -> bool:
     return not input_str.lstrip().startswith('=====')
 
-def get_project_details(project_path: str) -> Project:
+@functools.lru_cache(maxsize=None)
+@timed('project_details')
+def get_project_details(project_path: str, commit: Optional[str] = None) -> Project:
     """
     Returns the project details from the project path.
 
     Args:
         project_path (str): The project path.
+        commit (str, optional): The commit the project is read at, instead of its HEAD.
 
     Returns:
         Project: The project details.
     """
-    project_name = os.path.basename(project_path)
-
-    def run_git_command(command):
-        try:
-            result = subprocess.run(
-                command,
-                cwd=project_path,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                check=True
-            )
-            return result.stdout.strip()
-        except subprocess.CalledProcessError as e:
-            print(f"Error executing Git command: {e.stderr}")
-            return ""
-
-    # Get repository URL
-    repo_url = run_git_command(["git", "config", "--get", "remote.origin.url"])
-
-    # Get tags pointing to HEAD
-    tags = run_git_command(["git", "describe", "--tags"])
-
-    # Get current commit hash
-    commit = run_git_command(["git", "rev-parse", "HEAD"])
-
+    cache = get_describe_cache(os.path.join(get_index_dir(project_path), 'git-describe.json'))
+    repo_url, tags, commit = read_git_metadata(project_path, cache, commit)
     return Project(
-        name=project_name,
+        name=os.path.basename(project_path),
         repo_url=repo_url,
         tags=tags,
         commit=commit
     )
 
-def main(projects_root: str, input_file: str, output_file: str, mapping_file: Optional[str] = None) -> None:
+def get_projects_details(project_paths: List[str], revisions: Optional[Revisions] = None) -> List[Project]:
+    """Collects the details of several projects concurrently, in the given order"""
+    if not project_paths:
+        return []
+    commits = {pin.project: pin.commit for pin in revisions or () if not pin.error}
+    with ThreadPoolExecutor(max_workers=min(8, len(project_paths))) as executor:
+        projects = list(executor.map(get_project_details, project_paths,
+                                     [commits.get(os.path.basename(path)) for path in project_paths]))
+    save_describe_caches()
+    return projects
+
+def load_mapping(mapping_file: Optional[str]) -> Optional[PackageTrie]:
+    """Load and compile the package prefix to directory mapping file, exiting on error"""
+    if not mapping_file:
+        return None
+    try:
+        with open(mapping_file, 'rb') as f:
+            return compile_mapping(tomllib.load(f))
+    except Exception as e:
+        print(f"Error loading mapping file: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+@timed('locate_stacks')
+def locate_stacks(data: dict, full_projects_root: str, mapping: Optional[PackageTrie] = None,
+                  executor: Optional[Executor] = None,
+                  revisions: Optional[Revisions] = None) -> Tuple[List[Frame], List[Frame]]:
+    """
+    Splits the report's stack trace into its two stacks and locates every
+    frame. Reports read from RV logs carry their stacks already split, as
+    lists of frame lines under 'stacks'. Projects in revisions are read at
+    their commit.
+    """
+    if 'stacks' in data:
+        fst_st, snd_st = ('\n'.join(lines) for lines in data['stacks'])
+    else:
+        raw_stack_trace = data['stack_trace']
+        rv_format = is_rv_format(raw_stack_trace)
+        extract_func = extract_stack_trace_rv if rv_format else extract_stack_trace
+        fst_st, snd_st = extract_func(raw_stack_trace)
+    fst = helper(fst_st, full_projects_root, mapping, executor, revisions)
+    snd = helper(snd_st, full_projects_root, mapping, executor, revisions)
+    return fst, snd
+
+def generate_report(full_projects_root: str, input_file: str, output_file: str, mapping: Optional[PackageTrie] = None,
+                    executor: Optional[Executor] = None, options: Optional[RenderOptions] = None) -> None:
+    """
+    Reads one input TOML file and writes its report. Depending on
+    options.output_format the output file gets the HTML report or the NDJSON
+    records; with 'both' the records go next to the HTML in a .ndjson file.
+    """
+    with open(input_file, 'rb') as infile:
+        data = tomllib.load(infile)
+    write_report_file(data, output_file, full_projects_root, mapping, executor, options)
+
+def write_report_file(data: dict, output_file: str, full_projects_root: str, mapping: Optional[PackageTrie] = None,
+                      executor: Optional[Executor] = None, options: Optional[RenderOptions] = None) -> None:
+    """Writes the report of loaded input data to output_file, in the format of options.output_format"""
+    options = options or RenderOptions()
+    if options.commits:
+        data = {**data, 'commits': {**data.get('commits', {}), **options.commits}}
+    if options.output_format == 'ndjson':
+        with open(output_file, 'w', encoding='utf-8') as outfile:
+            write_ndjson(iter_report_records(data, full_projects_root, mapping, executor,
+                                             snippet_cache=options.snippet_cache, snippets=options.snippets),
+                         outfile)
+        return
+    if not options.snippets:
+        records = iter_report_records(data, full_projects_root, mapping, executor, snippets=False)
+        with open(output_file, 'w', encoding='utf-8') as outfile:
+            if options.output_format == 'both':
+                with open(get_ndjson_path(output_file), 'w', encoding='utf-8') as ndjson:
+                    write_resolved(outfile, stream_records(records, ndjson))
+            else:
+                write_resolved(outfile, records)
+        return
+    stylesheet = write_assets(options, output_file) if options.compact else None
+    with open(output_file, 'w') as outfile:
+        if options.output_format == 'both':
+            with open(get_ndjson_path(output_file), 'w', encoding='utf-8') as ndjson:
+                write_report(outfile, data, full_projects_root, mapping, executor, options, stylesheet, ndjson)
+        else:
+            write_report(outfile, data, full_projects_root, mapping, executor, options, stylesheet)
+
+def get_ndjson_path(output_file: str) -> str:
+    return f'{os.path.splitext(output_file)[0]}.ndjson'
+
+def get_output_extension(options: Optional[RenderOptions] = None) -> str:
+    """Returns the extension of the files written with options, for the output directories of batch runs"""
+    if options and options.output_format == 'ndjson':
+        return '.ndjson'
+    if options and not options.snippets:
+        return '.tsv'
+    return '.html'
+
+def iter_report_records(data: dict, full_projects_root: str, mapping: Optional[PackageTrie] = None,
+                        executor: Optional[Executor] = None, highlight: bool = False,
+                        snippet_cache: bool = True, snippets: bool = True) -> Iterator[dict]:
+    """
+    Resolves a report into its records: one 'report' record, then one
+    'frame' record per frame, row by row alternating between the two stacks.
+    Frame records are produced lazily, as their snippets are extracted.
+
+    Args:
+        data (dict): The loaded input TOML. Its optional 'commits' table maps
+            project directories to the revision their sources are read at,
+            straight from git, instead of the working tree.
+        full_projects_root (str): The absolute root directory of the projects.
+        mapping (PackageTrie, optional): The compiled package prefix to directory mapping.
+        executor (Executor, optional): Pool used to resolve frames in parallel.
+        highlight (bool): Attach highlighted HTML rows of each snippet for the HTML renderer.
+        snippet_cache (bool): Reuse and store snippets in the on-disk cache next to the projects root.
+        snippets (bool): Extract snippets; without them frame records have no spans and
+            tree-sitter is never loaded.
+
+    Returns:
+        Iterator[dict]: The report's records.
+    """
+    revisions = resolve_revisions(full_projects_root, data.get('commits', {}))
+    fst, snd = locate_stacks(data, full_projects_root, mapping, executor, revisions)
+    accessed_proj_dirs = sorted(list(
+                            map(lambda x: os.path.join(full_projects_root, x),
+                                get_accessed_projects(fst) | get_accessed_projects(snd))))
+    yield report_record(data, get_projects_details(accessed_proj_dirs, revisions), (len(fst), len(snd)))
+    if snippets:
+        cache_path = get_snippet_cache_path(full_projects_root) if snippet_cache else None
+        fst_cells = zip(fst, iter_snippets(fst, executor, highlight, cache_path))
+        snd_cells = zip(snd, iter_snippets(snd, executor, highlight, cache_path))
+    else:
+        fst_cells = zip(fst, repeat(None))
+        snd_cells = zip(snd, repeat(None))
+    for depth, (fst_cell, snd_cell) in enumerate(zip_longest(fst_cells, snd_cells)):
+        if fst_cell:
+            yield frame_record(*fst_cell, full_projects_root, 0, depth)
+        if snd_cell:
+            yield frame_record(*snd_cell, full_projects_root, 1, depth)
+
+def get_snippet_cache_path(full_projects_root: str) -> str:
+    return os.path.join(get_root_index_dir(full_projects_root), 'snippets.sqlite')
+
+def write_report(outfile: TextIO, data: dict, full_projects_root: str, mapping: Optional[PackageTrie] = None,
+                 executor: Optional[Executor] = None, options: Optional[RenderOptions] = None,
+                 stylesheet: Optional[str] = None, ndjson: Optional[TextIO] = None) -> None:
+    """
+    Writes the HTML report for a loaded input file.
+
+    Args:
+        outfile (TextIO): Where the HTML is written.
+        data (dict): The loaded input TOML.
+        full_projects_root (str): The absolute root directory of the projects.
+        mapping (PackageTrie, optional): The compiled package prefix to directory mapping.
+        executor (Executor, optional): Pool used to resolve frames in parallel.
+        options (RenderOptions, optional): How the report is rendered.
+        stylesheet (str, optional): Stylesheet URL linked by compact reports.
+        ndjson (TextIO, optional): Also stream the report's records here as NDJSON.
+    """
+    options = options or RenderOptions()
+    records = iter_report_records(data, full_projects_root, mapping, executor, options.compact,
+                                  options.snippet_cache)
+    if ndjson is not None:
+        records = stream_records(records, ndjson)
+    write_html(outfile, records, full_projects_root, options, stylesheet)
+
+def write_resolved(outfile: TextIO, records: Iterator[dict]) -> None:
+    """
+    Writes one tab-separated line per frame record: its stack, depth and
+    status, then 'path:line' for resolved frames, the frame itself for
+    frames without a line number, or the error.
+    """
+    next(records)
+    for record in records:
+        if record['status'] == 'resolved':
+            location = f"{record['path']}:{record['line']}"
+        elif record['status'] == 'unknown':
+            location = record['frame']
+        else:
+            location = record['error']
+        outfile.write(f"{record['stack']}\t{record['depth']}\t{record['status']}\t{location}\n")
+
+@timed('write_html')
+def write_html(outfile: TextIO, records: Iterator[dict], full_projects_root: str,
+               options: Optional[RenderOptions] = None, stylesheet: Optional[str] = None) -> None:
+    """Renders a report's records as HTML, writing each row as soon as its frames arrive"""
+    options = options or RenderOptions()
+    report = next(records)
+    originating_test = html.escape(report['originating_test'])
+    field_declaration = html.escape(report['field_declaration'])
+    algorithm = html.escape(report['algorithm'])
+    fst_depth, snd_depth = report['depths']
+    if options.compact:
+        outfile.write(COMPACT_HEADER.format(stylesheet=html.escape(stylesheet or 'assets/report.css')))
+    else:
+        outfile.write(HEADER)
+    outfile.write('<div class="header">\n')
+    outfile.write('<h1>Originating Test:</h1>\n')
+    outfile.write(f'<h2>{originating_test}</h2>\n')
+    outfile.write('<h1>Algorithm:</h1>\n')
+    outfile.write(f'<h2>{algorithm}</h2>\n')
+    outfile.write('<div class="table-container"><table><thead><tr><th><h2>Project</h2</th><th><h2>Version</h2></th><th><h2>Commit</h2></tr></thead><tbody>\n')
+    for project_details in report['projects']:
+        outfile.write(f'<tr>')
+        outfile.write(f'<td><a target="_blank" rel="noopener noreferrer" href="{project_details['repo_url']}">{project_details['name']}</a></td>')
+        outfile.write(f'<td>{project_details['tags']}</td>')
+        outfile.write(f'<td>{project_details['commit']}</td>')
+        outfile.write('</tr>')
+    outfile.write('</tbody></table></div>\n')
+    outfile.write('<h1>Field Declaration:</h1>\n')
+    outfile.write('<div class="header-code">\n')
+    if options.compact:
+        outfile.write(output_code(None, highlight_source(report['field_declaration'].strip('\n'))))
+    else:
+        outfile.write(f'<pre><code class="large-code language-java nohljsln">{field_declaration}</code></pre>\n')
+    outfile.write('</div>\n')
+    outfile.write('</div>\n')
+    outfile.write(TABLE_HEADER)
+    outfile.write('<tr>\n')
+    outfile.write(f'<td><strong>Depth:</strong> {fst_depth}</td>\n')
+    outfile.write(f'<td><strong>Depth:</strong> {snd_depth}</td>\n')
+    outfile.write('</tr>\n')
+    # Rows are written as soon as both of their cells are rendered, so
+    # only one row of snippets is held in memory at a time
+    renderer = CellRenderer(full_projects_root, options)
+    for _depth, row in groupby(records, key=lambda record: record['depth']):
+        cells = ['<td></td>', '<td></td>']
+        for record in row:
+            cells[record['stack']] = renderer.render(record)
+        outfile.write('<tr>\n')
+        outfile.write(cells[0])
+        outfile.write(cells[1])
+        outfile.write('</tr>\n')
+    outfile.write(FOOTER)
+
+def main(projects_root: str, input_file: str, output_file: str, mapping_file: Optional[str] = None, jobs: int = 1,
+         options: Optional[RenderOptions] = None) -> None:
     """Main function that reads input lines and processes each one"""
     full_projects_root = os.path.abspath(projects_root)
+    mapping = load_mapping(mapping_file)
+
+    try:
+        if jobs > 1:
+            with make_executor(jobs) as executor:
+                generate_report(full_projects_root, input_file, output_file, mapping, executor, options)
+        else:
+            generate_report(full_projects_root, input_file, output_file, mapping, options=options)
+    except IOError as e:
+        print(f"File error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+# Workers of the pools created by make_executor
+_EXECUTOR_JOBS: 'weakref.WeakKeyDictionary[Executor, int]' = weakref.WeakKeyDictionary()
+
+def expand_inputs(inputs: str) -> List[str]:
+    """
+    Expands a directory or glob pattern into a sorted list of input TOML files.
+
+    Args:
+        inputs (str): A directory containing *.toml files, or a glob pattern.
+
+    Returns:
+        List[str]: The matching input files.
+    """
+    if os.path.isdir(inputs):
+        inputs = os.path.join(inputs, '*.toml')
+    return sorted(path for path in glob.glob(inputs, recursive=True) if os.path.isfile(path))
+
+def get_inputs_base(inputs: str) -> str:
+    """Returns the directory a directory or glob pattern of inputs starts from, before its first wildcard"""
+    if os.path.isdir(inputs):
+        return inputs
+    parts = []
+    for part in os.path.dirname(inputs).split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts) or (os.sep if inputs.startswith(os.sep) else os.curdir)
+
+def get_batch_output_paths(input_files: List[str], inputs: str, output_dir: str, extension: str) -> List[str]:
+    """
+    Returns the report path of each input file, mirroring its path relative
+    to where inputs starts under output_dir, so that inputs of the same name
+    in different directories of a recursive glob get reports of their own.
+    """
+    base = get_inputs_base(inputs)
+    return [os.path.join(output_dir, os.path.splitext(os.path.relpath(input_file, base))[0] + extension)
+            for input_file in input_files]
+
+def make_executor(jobs: int) -> Executor:
+    """Creates the worker pool, carrying the source cache limit and profiling settings over to the workers"""
+    # Imported here as multiprocessing adds noticeably to the startup of single-process runs
+    from concurrent.futures import ProcessPoolExecutor
+    executor = ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                                   initargs=(SOURCE_CACHE.max_bytes, get_ignore_globs(), instrument.is_tracing(),
+                                             instrument.get_spool_dir()))
+    _EXECUTOR_JOBS[executor] = jobs
+    return executor
 
-    # Load mapping file if provided
-    mapping = None
-    if mapping_file:
+def get_executor_window(executor: Executor) -> int:
+    """Returns how many tasks to keep in flight on an executor: enough to keep each of its workers busy"""
+    return 2 * _EXECUTOR_JOBS.get(executor, 1)
+
+def init_worker(source_cache_bytes: int, ignore_globs: Tuple[str, ...], trace: bool,
+                profile_dir: Optional[str]) -> None:
+    SOURCE_CACHE.set_limit(source_cache_bytes)
+    set_ignore_globs(ignore_globs)
+    if profile_dir:
+        instrument.init_worker(trace, profile_dir)
+
+def start_profile(trace_file: Optional[str]) -> None:
+    """Starts collecting spans and counters, in this process and in the workers it starts"""
+    instrument.enable(trace=bool(trace_file), spool_dir=tempfile.mkdtemp(prefix='stacktrace-profile-'))
+
+def finish_profile(trace_file: Optional[str]) -> None:
+    """Prints the profile summary, including exited workers, and writes the trace file if requested"""
+    spool_dir = instrument.get_spool_dir()
+    if spool_dir:
+        instrument.merge_spool(spool_dir)
+        shutil.rmtree(spool_dir, ignore_errors=True)
+    instrument.print_summary()
+    if trace_file:
         try:
-            with open(mapping_file, 'rb') as f:
-                mapping = tomllib.load(f)
-        except Exception as e:
-            print(f"Error loading mapping file: {str(e)}", file=sys.stderr)
-            sys.exit(1)
+            instrument.write_chrome_trace(trace_file)
+        except OSError as e:
+            print(f"Could not write trace file: {e}", file=sys.stderr)
 
+def run_report(full_projects_root: str, input_file: str, output_file: str, mapping: Optional[PackageTrie] = None,
+               options: Optional[RenderOptions] = None) -> Optional[str]:
+    """Generates one report, returning an error message instead of raising"""
     try:
-        with open(input_file, 'rb') as infile, open(output_file, 'w') as outfile:
-            data = tomllib.load(infile)
-            originating_test = html.escape(data['originating_test'])
-            field_declaration = html.escape(data['field_declaration'])
-            algorithm = html.escape(data['algorithm'])
-            raw_stack_trace = data['stack_trace']
-            rv_format = is_rv_format(raw_stack_trace)
-            extract_func = extract_stack_trace_rv if rv_format else extract_stack_trace
-            fst_st, snd_st = extract_func(raw_stack_trace)
-            fst = helper(fst_st.split('\n'), full_projects_root, mapping)
-            snd = helper(snd_st.split('\n'), full_projects_root, mapping)
-            accessed_proj_dirs = sorted(list(
-                                    map(lambda x: os.path.join(full_projects_root, x),
-                                        ACCESSED_PROJECTS)))
-            outfile.write(HEADER)
-            outfile.write('<div class="header">\n')
-            outfile.write('<h1>Originating Test:</h1>\n')
-            outfile.write(f'<h2>{originating_test}</h2>\n')
-            outfile.write('<h1>Algorithm:</h1>\n')
-            outfile.write(f'<h2>{algorithm}</h2>\n')
-            outfile.write('<div class="table-container"><table><thead><tr><th><h2>Project</h2</th><th><h2>Version</h2></th><th><h2>Commit</h2></tr></thead><tbody>\n')
-            for proj_dir in accessed_proj_dirs:
-                project_details = get_project_details(proj_dir)
-                outfile.write(f'<tr>')
-                outfile.write(f'<td><a target="_blank" rel="noopener noreferrer" href="{project_details.repo_url}">{project_details.name}</a></td>')
-                outfile.write(f'<td>{project_details.tags}</td>')
-                outfile.write(f'<td>{project_details.commit}</td>')
-                outfile.write('</tr>')
-            outfile.write('</tbody></table></div>\n')
-            outfile.write('<h1>Field Declaration:</h1>\n')
-            outfile.write('<div class="header-code">\n')
-            outfile.write(f'<pre><code class="large-code language-java nohljsln">{field_declaration}</code></pre>\n')
-            outfile.write('</div>\n')
-            outfile.write('</div>\n')
-            outfile.write(TABLE_HEADER)
-            outfile.write('<tr>\n')
-            outfile.write(f'<td><strong>Depth:</strong> {len(fst)}</td>\n')
-            outfile.write(f'<td><strong>Depth:</strong> {len(snd)}</td>\n')
-            outfile.write('</tr>\n')
-            longer_index = max(len(fst), len(snd))
-            result = ''
-            for i in range(longer_index):
-                result += '<tr>\n'
-                result += fst[i] if i < len(fst) else '<td></td>'
-                result += snd[i] if i < len(snd) else '<td></td>'
-                result += '</tr>\n'
-            outfile.write(result)
-            outfile.write(FOOTER)
+        generate_report(full_projects_root, input_file, output_file, mapping, options=options)
+    except (IOError, tomllib.TOMLDecodeError, KeyError) as e:
+        return f"Error processing {input_file}: {str(e)}"
+    return None
+
+def main_batch(projects_root: str, inputs: str, output_dir: str, mapping_file: Optional[str] = None, jobs: int = 1,
+               options: Optional[RenderOptions] = None) -> None:
+    """
+    Generates one HTML report per input TOML file in a single process, so the
+    file indexes, parsed sources and git metadata are shared between reports.
+    With more than one job, whole reports are distributed over a process pool.
+    """
+    full_projects_root = os.path.abspath(projects_root)
+    mapping = load_mapping(mapping_file)
+    input_files = expand_inputs(inputs)
+    if not input_files:
+        print(f"No input files found for: {inputs}", file=sys.stderr)
+        sys.exit(1)
+    output_files = get_batch_output_paths(input_files, inputs, output_dir, get_output_extension(options))
+    for directory in sorted(set(map(os.path.dirname, output_files))):
+        os.makedirs(directory, exist_ok=True)
+    if jobs > 1:
+        with make_executor(jobs) as executor:
+            errors = list(executor.map(run_report, repeat(full_projects_root), input_files, output_files,
+                                       repeat(mapping), repeat(options)))
+    else:
+        errors = [run_report(full_projects_root, input_file, output_file, mapping, options)
+                  for input_file, output_file in zip(input_files, output_files)]
+
+    failed = 0
+    for error in errors:
+        if error:
+            print(error, file=sys.stderr)
+            failed += 1
+    print(f"Generated {len(input_files) - failed}/{len(input_files)} reports in {output_dir}", file=sys.stderr)
+    if failed:
+        sys.exit(1)
 
+def race_report_data(race: Race, log_file: str) -> dict:
+    """Returns the report input of a race read from an RV log, shaped like a loaded input TOML"""
+    return {
+        'originating_test': f'{os.path.basename(log_file)}#race-{race.index}',
+        'algorithm': 'RV-Predict',
+        'field_declaration': race.description,
+        'stacks': race.stacks,
+    }
+
+def get_race_output_path(output_dir: str, race: Race, options: Optional[RenderOptions] = None) -> str:
+    return os.path.join(output_dir, f'race-{race.index:05d}{get_output_extension(options)}')
+
+def run_race_report(full_projects_root: str, data: dict, output_file: str, mapping: Optional[PackageTrie] = None,
+                    options: Optional[RenderOptions] = None) -> Optional[str]:
+    """Generates the report of one race, returning an error message instead of raising"""
+    try:
+        write_report_file(data, output_file, full_projects_root, mapping, options=options)
+    except IOError as e:
+        return f"Error processing {data['originating_test']}: {str(e)}"
+    return None
+
+def iter_race_reports(full_projects_root: str, log: TextIO, log_file: str, output_dir: str,
+                      mapping: Optional[PackageTrie] = None, executor: Optional[Executor] = None,
+                      options: Optional[RenderOptions] = None, window: int = 1) -> Iterator[Optional[str]]:
+    """
+    Reports every race of an RV log as soon as it has been read. With an
+    executor, at most window races are being resolved at a time, so memory
+    stays bounded however long the log is.
+
+    Returns:
+        Iterator[Optional[str]]: The error message of each race, or None, in log order.
+    """
+    pending = deque()
+    for race in iter_races(log):
+        data = race_report_data(race, log_file)
+        output_file = get_race_output_path(output_dir, race, options)
+        if executor is None:
+            yield run_race_report(full_projects_root, data, output_file, mapping, options)
+            continue
+        pending.append(executor.submit(run_race_report, full_projects_root, data, output_file, mapping, options))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def main_rv_log(projects_root: str, log_file: str, output_dir: str, mapping_file: Optional[str] = None,
+                jobs: int = 1, options: Optional[RenderOptions] = None) -> None:
+    """
+    Reads a raw RV-Predict log, '-' for stdin, line by line and writes one
+    report per race into output_dir. With more than one job, races are
+    distributed over a process pool.
+    """
+    full_projects_root = os.path.abspath(projects_root)
+    mapping = load_mapping(mapping_file)
+    os.makedirs(output_dir, exist_ok=True)
+
+    total = failed = 0
+    try:
+        with (open(log_file, 'r', encoding='utf-8', errors='replace') if log_file != '-'
+              else contextlib.nullcontext(sys.stdin)) as log:
+            with make_executor(jobs) if jobs > 1 else contextlib.nullcontext() as executor:
+                for error in iter_race_reports(full_projects_root, log, log_file, output_dir, mapping, executor,
+                                               options, window=jobs * 2):
+                    total += 1
+                    if error:
+                        print(error, file=sys.stderr)
+                        failed += 1
     except IOError as e:
         print(f"File error: {str(e)}", file=sys.stderr)
         sys.exit(1)
+    print(f"Generated {total - failed}/{total} race reports in {output_dir}", file=sys.stderr)
+    if failed:
+        sys.exit(1)
 
 def extract_stack_trace(input_str: str) -> Tuple[str, str]:
     lines = input_str.split('\n')
@@ -241,120 +810,66 @@ def extract_stack_trace_rv(input_str: str) -> Tuple[str, str]:
     snd_out = '\n'.join(snd_sec)
     return fst_out, snd_out
 
-def preprocess_input(input_str: str) -> str:
-    """
-    Processes a multi-line string containing stack trace entries and returns cleaned lines.
-
-    Args:
-        input_str: A string containing stack trace lines with leading 'at' and possible '>' characters.
-
-    Returns:
-        A string with each line cleaned of leading 'at', '>', and whitespace, joined by newlines.
-    """
-    processed_lines = []
-    for line in input_str.strip().split('\n'):
-        # Remove leading whitespace, '>', 'at' and any surrounding whitespace
-        cleaned_line = re.sub(r'^\s*>*\s*at\s+', '', line.strip())
-        processed_lines.append(cleaned_line)
-    return '\n'.join(processed_lines)
-
-def parse_line(line: str) -> Tuple[Optional[LineData], Optional[str]]:
-    """Parse input line into components with error checking"""
-    line = line.strip()
-    if not line:
-        return None, "Empty line"
-
-    # Split method signature and file info
-    try:
-        method_part, rest = line.split('(', 1)
-    except ValueError:
-        return None, f"Invalid line format: {line}"
-
-    # Extract file and line number information
-    file_line_part = rest.split(')')[0]
-    try:
-        filename, line_num_str = file_line_part.split(':')
-        if line_num_str != "n/a":
-            line_num = int(line_num_str)
-        else:
-            # Unknown file and line number
-            line_num = -1
-    except ValueError:
-        return None, f"Invalid file:line format in line: {line}"
-
-    # Process method signature to get package structure
-    method_parts = method_part.split('.')
-    if len(method_parts) < 2:
-        return None, f"Invalid method format: {method_part}"
-
-    # Construct expected file suffix
-    package_parts = method_parts[:-2]  # Remove class and method names
-    dir_path = '/'.join(package_parts)
-    expected_suffix = os.path.join(dir_path, filename).replace(os.sep, '/')
-
-    return LineData(
-        filename=filename,
-        filepath="",
-        package='.'.join(method_parts[:-1]),
-        method=method_parts[-1],
-        line_num=line_num,
-        expected_suffix=expected_suffix,
-        line_of_code=""
-    ), None
-
-def get_directories(projects_root: str) -> List[str]:
-    """Get all directories in the project root"""
-    return [name for name in os.listdir(projects_root) if os.path.isdir(os.path.join(projects_root, name))]
-
-def find_most_likely_project(package_name: str, project_directories: List[str], mapping: Optional[dict] = None) -> Optional[str]:
+@timed('resolve_project')
+def find_most_likely_project(package_name: str, project_directories: ProjectDirectories, mapping: Optional[PackageTrie] = None) -> Optional[str]:
     """
     Find the most likely project for a given package name.
 
     Args:
         package_name (str): The Java package name.
-        project_directories (list): A list of project directories.
-        mapping (dict, optional): A mapping of package prefixes to directory names.
+        project_directories (ProjectDirectories): The listing of project directories.
+        mapping (PackageTrie, optional): The compiled package prefix to directory mapping.
 
     Returns:
         str: The most likely project directory.
     """
-    # First check the mapping if provided
+    # First check the mapping if provided, the longest matching prefix wins
     if mapping:
-        for prefix, directory in mapping.items():
-            if package_name.startswith(prefix):
-                return directory
-
-    # Fall back to existing logic
-    package_parts = package_name.split('.')
-    for part in package_parts:
-        for project in project_directories:
-            if part.lower() == project.lower():
-                return project
+        directory = mapping.longest_match(package_name)
+        if directory is not None:
+            return directory
 
-    return None
+    # Fall back to a project named like one of the package segments
+    return match_project_name(package_name, project_directories.lookup)
 
+@timed('find_file')
 def find_file_by_suffix(project_root: str, expected_suffix: str) -> List[str]:
-    """Search directory tree for files matching path suffix"""
-    matches: List[str] = []
-    normalized_suffix = expected_suffix.replace(os.sep, '/')
-
-    for root, _dirs, files in os.walk(project_root):
-        for file in files:
-            full_path = os.path.join(root, file)
-            rel_path = os.path.relpath(full_path, os.getcwd()).replace(os.sep, '/')
-            if rel_path.endswith(normalized_suffix):
-                matches.append(full_path)
-
-    return matches
+    """
+    Look up files matching path suffix, first by statting it under the
+    project's source roots and only then in the project's persistent file
+    index, which is built by walking the whole tree
+    """
+    return probe_source_roots(project_root, expected_suffix) or find_indexed_files(project_root, expected_suffix)
 
-def process_line(projects_root: str, data: LineData, mapping: Optional[dict] = None) -> Tuple[Optional[LineData], Optional[str]]:
+@timed('process_line')
+def process_line(projects_root: str, data: LineData, mapping: Optional[PackageTrie] = None,
+                 revisions: Optional[Revisions] = None) -> Tuple[Optional[LineData], Optional[str]]:
     """Process a parsed LineData object to find and read the source line"""
-    project = find_most_likely_project(data.package, get_directories(projects_root), mapping)
+    project = find_most_likely_project(data.package, get_project_directories(projects_root), mapping)
     if not project:
         return None, f"No project found for package: {data.package}"
     project_root = os.path.join(projects_root, project)
+    pin = find_pin(revisions, project)
     # Find matching files
-    matches = find_file_by_suffix(project_root, data.expected_suffix)
+    if pin is not None:
+        if pin.error:
+            return None, pin.error
+        try:
+            matches = find_revision_files(project_root, pin.commit, data.expected_suffix)
+        except OSError as e:
+            return None, f"Error reading {project} at {pin.commit}: {str(e)}"
+    else:
+        matches = find_file_by_suffix(project_root, data.expected_suffix)
+    if len(matches) != 1:
+        # Copies under shaded or generated trees, and files outside of their
+        # package's directory, are told apart by their package declaration
+        try:
+            declared = find_declaring_files(project_root, data.package, data.filename,
+                                            pin.commit if pin is not None else None)
+        except GitSourceError as e:
+            # Only raised for projects read at a commit
+            return None, f"Error reading {project} at {pin.commit}: {str(e)}"
+        matches = [path for path in declared if path in matches] or declared or matches
     if not matches:
         return None, f"No file found ending with '{data.expected_suffix}'"
     if len(matches) > 1:
@@ -364,38 +879,106 @@ def process_line(projects_root: str, data: LineData, mapping: Optional[dict] = N
 
     # Read and validate the source file
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            lines = file.readlines()
-            if data.line_num < 1 or data.line_num > len(lines):
-                return None, f"Line number {data.line_num} out of range in {file_path}"
-
-            code_line = lines[data.line_num - 1].rstrip('\n')
-            return LineData(
-                filename=data.filename,
-                filepath=file_path,
-                package=data.package,
-                method=data.method,
-                line_num=data.line_num,
-                expected_suffix=data.expected_suffix,
-                line_of_code=code_line,
-                project_dir=project,
-            ), None
+        source = read_source(file_path)
+        if data.line_num < 1 or data.line_num > source.line_count:
+            return None, f"Line number {data.line_num} out of range in {file_path}"
+
+        code_line = source.line(data.line_num - 1)
+        return LineData(
+            filename=data.filename,
+            filepath=file_path,
+            package=data.package,
+            method=data.method,
+            line_num=data.line_num,
+            expected_suffix=data.expected_suffix,
+            line_of_code=code_line,
+            project_dir=project,
+        ), None
 
     except FileNotFoundError:
         return None, f"File not found: {file_path}"
     except Exception as e:
         return None, f"Error reading {file_path}: {str(e)}"
 
-def output(data: LineData, class_details: dict, method_details: dict, relative_path: str) -> str:
-    result = "<td>\n"
-    result += f'<strong><code class="large-code packagename">{data.package}#{data.method}:{data.line_num}</code></strong><br>\n'
-    result += f'<p class="filepath">{relative_path}</p>\n'
-    result += '<strong class="seperator">Class</strong>\n'
-    result += f'<pre><code class="language-java large-code" data-ln-start-from="{class_details['start_line']}">{html.escape(class_details['content'])}</code></pre>\n'
-    result += '<strong class="seperator">Method</strong>\n'
-    result += f'<pre><code class="language-java large-code" data-ln-start-from="{method_details['start_line']}">{html.escape(method_details['content'])}</code></pre>\n'
-    result += "</td>"
-    return result
+def output(record: dict, class_snippet: str, method_snippet: str) -> str:
+    return ''.join((
+        "<td>\n",
+        f'<strong><code class="large-code packagename">{record['package']}#{record['method']}:{record['line']}</code></strong><br>\n',
+        f'<p class="filepath">{record['path']}</p>\n',
+        '<strong class="seperator">Class</strong>\n',
+        class_snippet,
+        '<strong class="seperator">Method</strong>\n',
+        method_snippet,
+        "</td>",
+    ))
+
+def output_snippet(details: dict, snippet_id: Optional[str] = None) -> str:
+    id_attr = f' id="{snippet_id}"' if snippet_id else ''
+    return f'<pre{id_attr}><code class="language-java large-code" data-ln-start-from="{details['start_line']}">{html.escape(details['content'])}</code></pre>\n'
+
+def fold_lines(details: dict, lines: List[str], focus_line: int, context: int) -> Optional[List[int]]:
+    """
+    Picks the indexes of the lines to keep when folding a method around its
+    frame line: the declaration line and context lines on either side of the
+    frame line. Returns None if the snippet is short enough to show whole.
+    """
+    if len(lines) <= 2 * context + 2:
+        return None
+    start = details['start_line']
+    focus = focus_line - start
+    keep = set(range(max(0, focus - context), min(len(lines), focus + context + 1)))
+    if details.get('declaration_line') is not None:
+        keep.add(details['declaration_line'] - start)
+    return sorted(index for index in keep if 0 <= index < len(lines))
+
+def output_code(start_line: Optional[int], lines: List[str], keep: Optional[List[int]] = None,
+                focus_line: Optional[int] = None, snippet_id: Optional[str] = None) -> str:
+    """
+    Renders pre-highlighted lines with line numbers (when start_line is
+    given), replacing the lines not in keep with a fold marker.
+    """
+    id_attr = f' id="{snippet_id}"' if snippet_id else ''
+    parts = [f'<pre{id_attr} class="code large-code"><code>']
+    indexes = keep if keep is not None else range(len(lines))
+    previous = -1
+    for index in indexes:
+        if index > previous + 1:
+            parts.append(f'<span class="fold">&#8943; {index - previous - 1} lines folded</span>')
+        previous = index
+        if start_line is None:
+            # A space keeps empty lines from collapsing
+            parts.append(f'<span class="line">{lines[index] or " "}</span>')
+            continue
+        line_num = start_line + index
+        line_class = 'line hl' if line_num == focus_line else 'line'
+        parts.append(f'<span class="{line_class}"><span class="ln">{line_num}</span>{lines[index]}</span>')
+    if previous < len(lines) - 1:
+        parts.append(f'<span class="fold">&#8943; {len(lines) - 1 - previous} lines folded</span>')
+    parts.append('</code></pre>\n')
+    return ''.join(parts)
+
+def write_assets(options: RenderOptions, output_file: str) -> str:
+    """
+    Writes the shared stylesheet of compact reports, once per asset
+    directory, and returns its path relative to output_file.
+    """
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    assets_dir = os.path.abspath(options.assets_dir or os.path.join(output_dir, 'assets'))
+    stylesheet = os.path.join(assets_dir, 'report.css')
+    if stylesheet not in _WRITTEN_ASSETS:
+        try:
+            with open(stylesheet, 'r') as f:
+                current = f.read()
+        except OSError:
+            current = None
+        if current != COMPACT_STYLE:
+            write_text_atomic(stylesheet, COMPACT_STYLE)
+        _WRITTEN_ASSETS.add(stylesheet)
+    return os.path.relpath(stylesheet, output_dir).replace(os.sep, '/')
+
+def output_snippet_ref(snippet_id: str, relative_path: str, details: dict) -> str:
+    return f'<p class="snippet-ref">Same as <a href="#{snippet_id}">{html.escape(relative_path)}:{details['start_line']}</a></p>\n'
+
 
 def output_unknown(line: str) -> str:
     return f'<td><strong><code class="large-code packagename">Unknown line</code></strong><br><div class="wrap">{html.escape(line)}</div></td>'
@@ -414,16 +997,125 @@ if __name__ == "__main__":
     )
     parser.add_argument(
         'input_file',
-        help='Path to input file containing stack traces'
+        help='Path to input file containing stack traces, or with --batch a directory or glob of input files'
     )
     parser.add_argument(
         'output_file',
-        help='Path to output file for code lines'
+        help='Path to output file for code lines, or with --batch the output directory'
     )
     parser.add_argument(
         '--mapping',
         help='Optional TOML file containing package prefix to directory mappings'
     )
+    parser.add_argument(
+        '--batch',
+        action='store_true',
+        help='Process every input file matched by input_file and write one HTML report per input into output_file, '
+             'mirroring the directories of recursive globs'
+    )
+    parser.add_argument(
+        '--rv-log',
+        action='store_true',
+        help='Read input_file, or stdin for "-", as a raw RV-Predict log with any number of races and write one '
+             'report per race into output_file'
+    )
+    parser.add_argument(
+        '--parse-cache-mb',
+        type=int,
+        default=DEFAULT_SOURCE_CACHE_BYTES // (1024 * 1024),
+        help='Maximum size in MB of Java sources kept in memory, along with their syntax trees'
+    )
+    parser.add_argument(
+        '--jobs', '-j',
+        type=int,
+        default=1,
+        help='Number of worker processes used to resolve frames, or whole reports with --batch'
+    )
+    parser.add_argument(
+        '--compact',
+        action='store_true',
+        help='Write styles once into a shared asset directory and highlight and fold code at generation time, '
+             'so reports open quickly and need no network'
+    )
+    parser.add_argument(
+        '--assets-dir',
+        help='Shared asset directory for --compact, defaults to "assets" next to the output'
+    )
+    parser.add_argument(
+        '--fold-context',
+        type=int,
+        default=8,
+        help='Lines kept around the frame line when --compact folds method bodies'
+    )
+    parser.add_argument(
+        '--format',
+        choices=('html', 'ndjson', 'both'),
+        default='html',
+        help='Write the HTML report, one JSON record per frame as NDJSON, or both (the NDJSON next to the HTML)'
+    )
+    parser.add_argument(
+        '--no-snippet-cache',
+        action='store_true',
+        help='Extract every snippet again instead of reusing the on-disk snippet cache next to projects_root'
+    )
+    parser.add_argument(
+        '--resolve-only', '--no-snippets',
+        dest='resolve_only',
+        action='store_true',
+        help='Only resolve frames to files and lines, writing one tab-separated line per frame (stack, depth, '
+             'status, path:line or error) instead of HTML, without loading the Java parser'
+    )
+    parser.add_argument(
+        '--commit',
+        action='append',
+        default=[],
+        metavar='PROJECT=REVISION',
+        help='Read the sources of a project directory at a commit, tag or branch straight from its git repository '
+             'instead of the working tree; can be repeated, and overrides the input\'s [commits] table'
+    )
+    parser.add_argument(
+        '--ignore',
+        action='append',
+        default=[],
+        metavar='GLOB',
+        help='Directory name pattern skipped when a project has to be walked to find a file, in addition to '
+             f'{", ".join(DEFAULT_IGNORE_GLOBS)}; can be repeated'
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Print the time spent in each stage and cache hit/miss counters to stderr when done'
+    )
+    parser.add_argument(
+        '--trace',
+        metavar='TRACE_FILE',
+        help='Also write every timed span to this Chrome trace event JSON file, implies --profile'
+    )
     args = parser.parse_args()
-    main(args.projects_root, args.input_file, args.output_file, args.mapping)
-
+    if args.profile or args.trace:
+        start_profile(args.trace)
+    SOURCE_CACHE.set_limit(args.parse_cache_mb * 1024 * 1024)
+    set_ignore_globs(DEFAULT_IGNORE_GLOBS + tuple(args.ignore))
+    commits = {}
+    for pin in args.commit:
+        project, separator, revision = pin.partition('=')
+        if not separator or not project or not revision:
+            parser.error(f"--commit expects PROJECT=REVISION, got '{pin}'")
+        commits[project] = revision
+    options = RenderOptions(compact=args.compact, assets_dir=args.assets_dir, fold_context=args.fold_context,
+                            output_format=args.format, snippet_cache=not args.no_snippet_cache,
+                            snippets=not args.resolve_only, commits=commits)
+    try:
+        if args.batch:
+            if options.compact and not options.assets_dir:
+                options.assets_dir = os.path.join(args.output_file, 'assets')
+            main_batch(args.projects_root, args.input_file, args.output_file, args.mapping, args.jobs, options)
+        elif args.rv_log:
+            if options.compact and not options.assets_dir:
+                options.assets_dir = os.path.join(args.output_file, 'assets')
+            main_rv_log(args.projects_root, args.input_file, args.output_file, args.mapping, args.jobs, options)
+        else:
+            main(args.projects_root, args.input_file, args.output_file, args.mapping, args.jobs, options)
+    finally:
+        if instrument.is_enabled():
+            finish_profile(args.trace)
@@ -0,0 +1,217 @@
+import os
+import re
+import sys
+import json
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from file_index import FileIndex, get_file_index, get_index_dir, write_json_atomic
+from gitsource import GitTree, get_git_tree, read_revision_file, split_revision_path
+from instrument import count, timed
+from source_roots import get_source_roots
+
+PACKAGE_INDEX_VERSION = 2
+
+# Bytes read from the start of each file; most package declarations come
+# within them, the rest after a long license header, for which up to
+# MAX_HEAD_BYTES are read
+HEAD_BYTES = 512
+MAX_HEAD_BYTES = 8192
+
+# The terminating ';' is required, so that a declaration cut off at the end
+# of the bytes read does not match a truncated package
+PACKAGE_PATTERN = re.compile(rb'^[ \t]*package[ \t]+([\w.]+)\s*;', re.MULTILINE)
+# Top-level declarations start at the beginning of a line, nested ones are indented
+TYPE_PATTERN = re.compile(
+    rb'^(?:(?:public|protected|private|abstract|final|sealed|non-sealed|static|strictfp)[ \t]+)*'
+    rb'(?:class|interface|enum|record|@interface)[ \t]+(\w+)', re.MULTILINE)
+
+# Package indexes by project root, with the file index they were built from;
+# projects read at a commit are keyed by their revision path
+_PACKAGE_INDEXES: Dict[str, Tuple[FileIndex, 'PackageIndex']] = {}
+_PACKAGE_INDEXES_LOCK = threading.Lock()
+
+@dataclass
+class PackageIndex:
+    project_root: str
+    fingerprint: dict
+    # path relative to project_root -> [package, top-level type names]
+    files: Dict[str, list]
+    # Fully-qualified top-level class -> relative paths, main sources first
+    _classes: Dict[str, List[str]] = field(default_factory=dict, repr=False)
+    # 'package/dir/File.java' as declared -> relative paths, main sources first
+    _declared: Dict[str, List[str]] = field(default_factory=dict, repr=False)
+
+    def __post_init__(self):
+        # A commit is assumed to have the source roots of the working tree
+        revision = split_revision_path(self.project_root)
+        source_roots = get_source_roots(revision[0] if revision else self.project_root)
+        roots = tuple(root.replace(os.sep, '/') + '/' for root in source_roots)
+
+        def priority(rel_path: str) -> int:
+            # Files in the standard source roots come first, main before test
+            return next((i for i, root in enumerate(roots) if rel_path.startswith(root)), len(roots))
+
+        for rel_path in sorted(self.files, key=priority):
+            package, types = self.files[rel_path]
+            prefix = f'{package}.' if package else ''
+            for type_name in types:
+                self._classes.setdefault(prefix + type_name, []).append(rel_path)
+            filename = rel_path.rsplit('/', 1)[-1]
+            declared = f"{package.replace('.', '/')}/{filename}" if package else filename
+            self._declared.setdefault(declared, []).append(rel_path)
+
+    def find_class(self, class_name: str) -> List[str]:
+        """
+        Returns the absolute paths of the files declaring a class.
+
+        Args:
+            class_name (str): Fully-qualified name as found in stack frames,
+                nested and anonymous classes included, e.g. 'io.demo.Foo$Bar$1'.
+
+        Returns:
+            List[str]: The files declaring its top-level class, main sources first.
+        """
+        top_level = class_name.split('$', 1)[0]
+        return [os.path.join(self.project_root, rel_path) for rel_path in self._classes.get(top_level, ())]
+
+    def find_declared(self, package: str, filename: str) -> List[str]:
+        """Returns the absolute paths of the files named filename declaring package"""
+        declared = f"{package.replace('.', '/')}/{filename}" if package else filename
+        return [os.path.join(self.project_root, rel_path) for rel_path in self._declared.get(declared, ())]
+
+def read_declarations(path: str) -> Tuple[str, List[str]]:
+    """
+    Returns the package and top-level types of a Java file, reading only as
+    much of its start as needed to find the package declaration. Types are
+    the file's name, which its public type must have, and any other
+    top-level declaration within the bytes read.
+    """
+    head = b''
+    try:
+        with open(path, 'rb') as f:
+            size = HEAD_BYTES
+            while True:
+                chunk = f.read(size - len(head))
+                head += chunk
+                if (PACKAGE_PATTERN.search(head) or not chunk or len(head) >= MAX_HEAD_BYTES
+                        or TYPE_PATTERN.search(head)):
+                    break
+                size *= 2
+    except OSError:
+        pass
+    return parse_declarations(head, path)
+
+def parse_declarations(head: bytes, path: str) -> Tuple[str, List[str]]:
+    """Returns the package and top-level types declared in the start of a Java file, as read_declarations"""
+    match = PACKAGE_PATTERN.search(head)
+    package = match.group(1).decode('ascii', 'replace') if match else ''
+    types = [os.path.basename(path).rsplit('.', 1)[0]]
+    for type_match in TYPE_PATTERN.finditer(head):
+        type_name = type_match.group(1).decode('ascii', 'replace')
+        if type_name not in types:
+            types.append(type_name)
+    return package, types
+
+def get_package_index_path(project_root: str) -> str:
+    project_name = os.path.basename(os.path.abspath(project_root).rstrip(os.sep))
+    return os.path.join(get_index_dir(project_root), f'{project_name}.packages.json')
+
+@timed('package_index.build')
+def build_package_index(file_index: FileIndex) -> PackageIndex:
+    """
+    Reads the declarations of every Java file in the file index, or in the
+    listing of a commit.
+
+    Raises:
+        GitSourceError: If a file cannot be read from the repository of a commit.
+    """
+    files = {}
+    for filename, rel_paths in file_index.files.items():
+        if filename.endswith('.java'):
+            for rel_path in rel_paths:
+                path = os.path.join(file_index.project_root, rel_path)
+                if isinstance(file_index, GitTree):
+                    package, types = parse_declarations(read_revision_file(path)[:MAX_HEAD_BYTES], path)
+                else:
+                    package, types = read_declarations(path)
+                files[rel_path] = [package, types]
+    return PackageIndex(project_root=file_index.project_root, fingerprint=file_index.fingerprint, files=files)
+
+def load_package_index(file_index: FileIndex) -> Optional[PackageIndex]:
+    """Loads the persisted package index built from the same files as file_index, if any"""
+    try:
+        with open(get_package_index_path(file_index.project_root), 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get('version') != PACKAGE_INDEX_VERSION or data.get('fingerprint') != file_index.fingerprint:
+        return None
+    java_files = {rel_path for filename, rel_paths in file_index.files.items() if filename.endswith('.java')
+                  for rel_path in rel_paths}
+    if set(data['files']) != java_files:
+        return None
+    return PackageIndex(project_root=file_index.project_root, fingerprint=data['fingerprint'], files=data['files'])
+
+def save_package_index(index: PackageIndex) -> None:
+    index_path = get_package_index_path(index.project_root)
+    try:
+        write_json_atomic(index_path, {
+            'version': PACKAGE_INDEX_VERSION,
+            'project_root': index.project_root,
+            'fingerprint': index.fingerprint,
+            'files': index.files,
+        })
+    except OSError as e:
+        print(f"Could not save package index to {index_path}: {e}", file=sys.stderr)
+
+def get_package_index(project_root: str, commit: Optional[str] = None) -> PackageIndex:
+    """
+    Returns the package index of a project, loading it from disk or building
+    it on first use. It follows the project's file index, and is rebuilt
+    whenever that one is. With a commit, it indexes the project's files at
+    that commit instead, and as those never change is never rebuilt.
+    """
+    project_root = os.path.abspath(project_root)
+    file_index = get_file_index(project_root) if commit is None else get_git_tree(project_root, commit)
+    project_root = file_index.project_root
+    with _PACKAGE_INDEXES_LOCK:
+        cached = _PACKAGE_INDEXES.get(project_root)
+    if cached is not None and cached[0] is file_index:
+        return cached[1]
+    index = load_package_index(file_index)
+    if index is None:
+        count('package_index.built')
+        index = build_package_index(file_index)
+        save_package_index(index)
+    with _PACKAGE_INDEXES_LOCK:
+        _PACKAGE_INDEXES[project_root] = (file_index, index)
+    return index
+
+def clear_caches() -> None:
+    """Drops every package index loaded by this process, leaving those saved on disk"""
+    with _PACKAGE_INDEXES_LOCK:
+        _PACKAGE_INDEXES.clear()
+
+def find_declaring_files(project_root: str, class_name: str, filename: str,
+                         commit: Optional[str] = None) -> List[str]:
+    """
+    Returns the files of a project that declare the class of a stack frame,
+    going by package declarations rather than paths.
+
+    Args:
+        project_root (str): The project directory.
+        class_name (str): The frame's fully-qualified class, e.g. 'io.demo.Foo$1'.
+        filename (str): The frame's file name, e.g. 'Foo.java'.
+        commit (str, optional): Look at the project's files at this commit.
+
+    Returns:
+        List[str]: The matching files, main sources first.
+    """
+    index = get_package_index(project_root, commit)
+    matches = [path for path in index.find_class(class_name) if os.path.basename(path) == filename]
+    if matches:
+        return matches
+    # Top-level classes that are not public may live in a file named differently
+    package = class_name.split('$', 1)[0].rpartition('.')[0]
+    return index.find_declared(package, filename)
@@ -0,0 +1,138 @@
+import os
+from typing import Dict, Iterable, Optional, Tuple
+
+# Key under which a trie node stores its directory. Package segments are
+# never empty, so it cannot collide with a child segment.
+_DIRECTORY = ''
+
+class PackageTrie:
+    """
+    Package prefix to project directory mapping, compiled into a trie of
+    package segments so that lookups take O(package depth) and the longest
+    matching prefix wins regardless of the order of the mapping file.
+    """
+    def __init__(self, mapping: Optional[dict] = None):
+        self.root: dict = {}
+        self.entries: Dict[str, str] = {}
+        self._hash: Optional[int] = None
+        self._add_all('', mapping or {})
+
+    def _add_all(self, parent: str, mapping: dict) -> None:
+        for prefix, directory in mapping.items():
+            full_prefix = f'{parent}.{prefix}' if parent else prefix
+            if isinstance(directory, dict):
+                # Unquoted dotted keys in TOML become nested tables
+                self._add_all(full_prefix, directory)
+            else:
+                self.insert(full_prefix, directory)
+
+    def insert(self, prefix: str, directory: str) -> None:
+        node = self.root
+        for part in prefix.strip('.').split('.'):
+            node = node.setdefault(part, {})
+        node[_DIRECTORY] = directory
+        self.entries[prefix] = directory
+        self._hash = None
+
+    def longest_match(self, package_name: str) -> Optional[str]:
+        """
+        Returns the directory of the longest mapped prefix of package_name.
+
+        Args:
+            package_name (str): The Java package name, e.g. 'org.eclipse.jetty.util.Foo'.
+
+        Returns:
+            Optional[str]: The mapped directory, or None if no prefix matches.
+        """
+        node = self.root
+        match = node.get(_DIRECTORY)
+        for part in package_name.split('.'):
+            node = node.get(part)
+            if node is None:
+                break
+            match = node.get(_DIRECTORY, match)
+        return match
+
+    def __bool__(self) -> bool:
+        return bool(self.root)
+
+    # Equal mappings hash alike, so memoized lookups keyed on a trie still hit
+    # when the trie is a copy, e.g. after being sent to a worker process
+    def __eq__(self, other) -> bool:
+        return isinstance(other, PackageTrie) and self.entries == other.entries
+
+    def __hash__(self) -> int:
+        if self._hash is None:
+            self._hash = hash(frozenset(self.entries.items()))
+        return self._hash
+
+def compile_mapping(mapping: Optional[dict]) -> Optional[PackageTrie]:
+    """Compiles a loaded mapping TOML file into a PackageTrie"""
+    if not mapping:
+        return None
+    return PackageTrie(mapping)
+
+def build_name_lookup(project_directories: Iterable[str]) -> Dict[str, str]:
+    """
+    Returns a lowercase name -> directory lookup for a directory listing.
+    When names differ only in case, the first one in the listing wins.
+    """
+    lookup: Dict[str, str] = {}
+    for project in project_directories:
+        lookup.setdefault(project.lower(), project)
+    return lookup
+
+def match_project_name(package_name: str, name_lookup: Dict[str, str]) -> Optional[str]:
+    """Returns the project named like the first matching segment of package_name"""
+    for part in package_name.split('.'):
+        project = name_lookup.get(part.lower())
+        if project is not None:
+            return project
+    return None
+
+class ProjectDirectories:
+    """
+    Listing of the project directories under a projects root.
+
+    The root is scanned once and the result reused for every frame, so
+    resolving a project costs no filesystem calls. Long-lived processes,
+    like the report server, check is_stale() and refresh() the listing when
+    the root's mtime changes.
+    """
+    def __init__(self, projects_root: str):
+        self.projects_root = projects_root
+        self.names: Tuple[str, ...] = ()
+        self.lookup: Dict[str, str] = {}
+        self._mtime = None
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Rescans the projects root"""
+        mtime = os.stat(self.projects_root).st_mtime_ns
+        # scandir reports the entry type from the directory listing itself on
+        # most filesystems, avoiding a stat per entry
+        with os.scandir(self.projects_root) as entries:
+            names = tuple(entry.name for entry in entries if entry.is_dir())
+        # Swap both at once so readers on other threads see a consistent view
+        self.names, self.lookup = names, build_name_lookup(names)
+        self._mtime = mtime
+
+    def is_stale(self) -> bool:
+        try:
+            return os.stat(self.projects_root).st_mtime_ns != self._mtime
+        except OSError:
+            return True
+
+# Listings shared by every report processed in this process
+_PROJECT_DIRECTORIES: Dict[str, ProjectDirectories] = {}
+
+def get_project_directories(projects_root: str) -> ProjectDirectories:
+    """Returns the process-wide listing of projects_root, scanning it on first use"""
+    directories = _PROJECT_DIRECTORIES.get(projects_root)
+    if directories is None:
+        directories = _PROJECT_DIRECTORIES[projects_root] = ProjectDirectories(projects_root)
+    return directories
+
+def clear_caches() -> None:
+    """Drops every listing, so that projects roots are scanned again on next use"""
+    _PROJECT_DIRECTORIES.clear()
@@ -0,0 +1,128 @@
+import os
+import json
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+if TYPE_CHECKING:
+    from main import Frame, Project
+
+# Record format version, bumped whenever a field changes meaning or is removed
+RECORD_VERSION = 1
+
+# Error message prefix -> category, so consumers can group failures without
+# matching on the messages themselves
+ERROR_CATEGORIES: Tuple[Tuple[str, str], ...] = (
+    ('Invalid', 'invalid_frame'),
+    ('Empty line', 'invalid_frame'),
+    ('No project found', 'no_project'),
+    ('No file found', 'no_file'),
+    ('File not found', 'no_file'),
+    ('Line number', 'line_out_of_range'),
+    ('Error reading', 'read_error'),
+)
+
+# Keys only meant for the HTML renderer, left out of the NDJSON output
+PRESENTATION_KEYS = ('highlighted',)
+
+def error_category(error: str) -> str:
+    for prefix, category in ERROR_CATEGORIES:
+        if error.startswith(prefix):
+            return category
+    return 'other'
+
+def span_record(details: dict) -> Optional[dict]:
+    """Returns the line span and source of a class or method snippet, or None if it was not found"""
+    if details['start_line'] is None:
+        return None
+    return {
+        'start_line': details['start_line'],
+        'end_line': details['start_line'] + details['content'].count('\n') - 1,
+        'declaration_line': details['declaration_line'],
+        'content': details['content'],
+    }
+
+def report_record(data: dict, projects: List['Project'], depths: Tuple[int, int]) -> dict:
+    """Returns the record describing a whole report, emitted before its frames"""
+    return {
+        'type': 'report',
+        'version': RECORD_VERSION,
+        'originating_test': data['originating_test'],
+        'algorithm': data['algorithm'],
+        'field_declaration': data['field_declaration'],
+        'projects': [
+            {'name': p.name, 'repo_url': p.repo_url, 'tags': p.tags, 'commit': p.commit}
+            for p in projects
+        ],
+        'depths': list(depths),
+    }
+
+def frame_record(frame: 'Frame', snippets: Optional[Tuple[dict, dict]], project_root: str, stack: int,
+                 depth: int) -> dict:
+    """
+    Returns the record of one resolved stack frame.
+
+    Args:
+        frame (Frame): The located frame.
+        snippets (Tuple[dict, dict], optional): Its class and method snippets,
+            None when they were not extracted, leaving the spans unset.
+        project_root (str): The root directory of the projects, which paths are made relative to.
+        stack (int): 0 for the first stack of the race, 1 for the second.
+        depth (int): Position of the frame in its stack.
+
+    Returns:
+        dict: The frame record. 'status' is 'resolved', 'unknown' for frames
+        without a line number, or 'error' with 'error' and 'error_category' set.
+    """
+    record = {
+        'type': 'frame',
+        'stack': stack,
+        'depth': depth,
+        'frame': frame.line,
+        'status': 'resolved',
+        'error': None,
+        'error_category': None,
+        'project': None,
+        'path': None,
+        'package': None,
+        'method': None,
+        'line': None,
+        'line_of_code': None,
+        'class_span': None,
+        'method_span': None,
+    }
+    if frame.error:
+        record.update(status='error', error=frame.error, error_category=error_category(frame.error))
+        return record
+    data = frame.data
+    record.update(package=data.package, method=data.method)
+    if data.line_num == -1:
+        record['status'] = 'unknown'
+        return record
+    record.update(
+        project=data.project_dir,
+        path=data.filepath.removeprefix(project_root).lstrip(os.sep),
+        line=data.line_num,
+        line_of_code=data.line_of_code,
+    )
+    if snippets is None:
+        return record
+    class_details, method_details = snippets
+    record.update(class_span=span_record(class_details), method_span=span_record(method_details))
+    if 'lines' in class_details:
+        record['highlighted'] = {'class': class_details['lines'], 'method': method_details['lines']}
+    return record
+
+def dump_record(record: dict) -> str:
+    """Serializes a record as one NDJSON line"""
+    if any(key in record for key in PRESENTATION_KEYS):
+        record = {key: value for key, value in record.items() if key not in PRESENTATION_KEYS}
+    return json.dumps(record, ensure_ascii=False) + '\n'
+
+def stream_records(records: Iterable[dict], outfile: TextIO) -> Iterator[dict]:
+    """Writes each record to outfile as NDJSON as it passes through"""
+    for record in records:
+        outfile.write(dump_record(record))
+        yield record
+
+def write_ndjson(records: Iterable[dict], outfile: TextIO) -> None:
+    for _record in stream_records(records, outfile):
+        pass
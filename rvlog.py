@@ -0,0 +1,92 @@
+import re
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# 'Data race on field java.util.ArrayList.size: {{{'
+RACE_HEADER_PATTERN = re.compile(r'^\s*Data race on (?P<description>.*?):?\s*(\{\{\{)?\s*$')
+# 'Concurrent write in thread T10 (locks held: {})', or 'Read in thread T2'
+ACCESS_PATTERN = re.compile(r'^\s*(?:Concurrent\s+)?(?P<kind>read|write)\s+in\s+thread\s+(?P<thread>\S+)',
+                            re.IGNORECASE)
+# Lines after an access stack that are not part of it, such as the stack
+# that created the thread
+ACCESS_END_PATTERN = re.compile(r'^\s*(?:Thread\b|T\d+\s+is\s+|\}\}\}|\{\{\{)')
+RACE_END_PATTERN = re.compile(r'^\s*\}\}\}\s*$')
+# The '---->' arrow RV-Predict puts before the accessing frame
+FRAME_MARKER_PATTERN = re.compile(r'^\s*-*>\s*')
+
+@dataclass
+class Access:
+    kind: str
+    thread: str
+    frames: List[str] = field(default_factory=list)
+
+@dataclass
+class Race:
+    # 1-based position of the race in the log
+    index: int
+    description: str
+    accesses: List[Access] = field(default_factory=list)
+
+    @property
+    def stacks(self) -> Tuple[List[str], List[str]]:
+        """The frames of the two conflicting accesses, in the order they are logged"""
+        first = self.accesses[0].frames if self.accesses else []
+        second = self.accesses[1].frames if len(self.accesses) > 1 else []
+        return first, second
+
+def iter_races(lines: Iterable[str]) -> Iterator[Race]:
+    """
+    Splits a raw RV-Predict log into races, reading it line by line so that
+    only the race being read is held in memory. Each race is yielded as soon
+    as its end is seen: a closing '}}}', the next race header, or a third
+    access in logs without headers.
+
+    Args:
+        lines (Iterable[str]): The log, e.g. an open file.
+
+    Returns:
+        Iterator[Race]: The races that have at least one access.
+    """
+    race: Optional[Race] = None
+    access: Optional[Access] = None
+    index = 0
+
+    def finish() -> Optional[Race]:
+        return race if race is not None and race.accesses else None
+
+    for line in lines:
+        line = line.rstrip('\r\n')
+        header = RACE_HEADER_PATTERN.match(line)
+        if header:
+            done = finish()
+            if done:
+                yield done
+            index += 1
+            race, access = Race(index, header.group('description').strip()), None
+            continue
+        if RACE_END_PATTERN.match(line):
+            done = finish()
+            if done:
+                yield done
+            race, access = None, None
+            continue
+        match = ACCESS_PATTERN.match(line)
+        if match:
+            if race is None or len(race.accesses) == 2:
+                done = finish()
+                if done:
+                    yield done
+                index += 1
+                race = Race(index, '')
+            access = Access(match.group('kind').lower(), match.group('thread'))
+            race.accesses.append(access)
+            continue
+        if access is None:
+            continue
+        if ACCESS_END_PATTERN.match(line):
+            access = None
+        elif line.strip():
+            access.frames.append(FRAME_MARKER_PATTERN.sub('', line))
+    done = finish()
+    if done:
+        yield done
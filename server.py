@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+import argparse
+import io
+import json
+import os
+import socketserver
+import sys
+import threading
+import tomllib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+from sources import SOURCE_CACHE, DEFAULT_SOURCE_CACHE_BYTES
+from file_index import invalidate_indexes
+from projects import PackageTrie, get_project_directories
+from template import COMPACT_STYLE
+from records import write_ndjson
+from main import (RenderOptions, clear_located_sources, get_project_details, iter_report_records, load_mapping,
+                  locate_source, located_sources_changed, write_report)
+
+STYLESHEET_PATH = '/assets/report.css'
+
+class ReportService:
+    """
+    Generates reports for one projects root inside a long-lived process, so
+    the project listing, file indexes, parsed sources and git metadata stay
+    in memory between requests.
+
+    The tree-sitter parser is not thread-safe, so reports are generated one
+    at a time; a background thread drops cached state whose files changed.
+    """
+    def __init__(self, projects_root: str, mapping: Optional[PackageTrie] = None, watch_interval: float = 5.0):
+        self.projects_root = os.path.abspath(projects_root)
+        self.mapping = mapping
+        self.watch_interval = watch_interval
+        self.directories = get_project_directories(self.projects_root)
+        self.reports = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Starts the thread that invalidates caches when the projects change"""
+        if self._watcher is not None:
+            return
+
+        def poll():
+            while not self._stop.wait(self.watch_interval):
+                try:
+                    self.check_for_changes()
+                except OSError as e:
+                    print(f"Could not check {self.projects_root} for changes: {e}", file=sys.stderr)
+
+        self._watcher = threading.Thread(target=poll, name='report-service-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def check_for_changes(self) -> bool:
+        """
+        Rescans the projects root and drops file indexes whose fingerprint
+        changed. Resolved frames and git metadata are cleared along with them,
+        since both may refer to files that moved, and also whenever a project
+        frames were resolved into moved to another commit or one of their
+        files changed: most frames are found by probing source roots, without
+        any file index to go stale. Parsed sources validate themselves by
+        mtime and are left alone.
+
+        Returns:
+            bool: Whether anything was invalidated.
+        """
+        with self._lock:
+            changed = False
+            if self.directories.is_stale():
+                self.directories.refresh()
+                changed = True
+            if invalidate_indexes():
+                changed = True
+            if located_sources_changed():
+                changed = True
+            if changed:
+                clear_located_sources()
+                get_project_details.cache_clear()
+            return changed
+
+    def invalidate(self) -> None:
+        """Drops every cache, as if the process had just started"""
+        with self._lock:
+            self.directories.refresh()
+            invalidate_indexes(stale_only=False)
+            clear_located_sources()
+            get_project_details.cache_clear()
+            SOURCE_CACHE.clear()
+
+    def render_html(self, data: dict, compact: bool = False) -> str:
+        """Returns the HTML report for a loaded input file"""
+        outfile = io.StringIO()
+        with self._lock:
+            write_report(outfile, data, self.projects_root, self.mapping, options=RenderOptions(compact=compact),
+                         stylesheet=STYLESHEET_PATH)
+            self.reports += 1
+        return outfile.getvalue()
+
+    def render_ndjson(self, data: dict) -> str:
+        """Returns the NDJSON records of a loaded input file"""
+        outfile = io.StringIO()
+        with self._lock:
+            write_ndjson(iter_report_records(data, self.projects_root, self.mapping), outfile)
+            self.reports += 1
+        return outfile.getvalue()
+
+    def health(self) -> dict:
+        return {
+            'status': 'ok',
+            'projects_root': self.projects_root,
+            'projects': len(self.directories.names),
+            'reports': self.reports,
+            'source_cache': {
+                'bytes': SOURCE_CACHE.total_bytes,
+                'max_bytes': SOURCE_CACHE.max_bytes,
+                'hits': SOURCE_CACHE.hits,
+                'misses': SOURCE_CACHE.misses,
+            },
+            'located_frames': locate_source.cache_info()._asdict(),
+        }
+
+class ReportRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET  /health             service and cache statistics as JSON
+    GET  /assets/report.css  stylesheet linked by compact reports
+    POST /report             input TOML in the body; returns HTML, or the
+                             NDJSON records with ?format=ndjson (or an
+                             Accept: application/x-ndjson header);
+                             ?compact=1 for compact HTML
+    POST /invalidate         drops every cache
+    """
+    service: ReportService
+
+    def do_GET(self) -> None:
+        path = urlsplit(self.path).path
+        if path == '/health':
+            self.send_json(200, self.service.health())
+        elif path == STYLESHEET_PATH:
+            self.send_body(200, 'text/css; charset=utf-8', COMPACT_STYLE)
+        else:
+            self.send_json(404, {'error': f'Not found: {path}'})
+
+    def do_POST(self) -> None:
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/invalidate':
+            self.service.invalidate()
+            self.send_json(200, {'status': 'ok'})
+            return
+        if url.path != '/report':
+            self.send_json(404, {'error': f'Not found: {url.path}'})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            data = tomllib.loads(self.rfile.read(length).decode('utf-8'))
+        except (UnicodeDecodeError, tomllib.TOMLDecodeError) as e:
+            self.send_json(400, {'error': f'Invalid TOML: {e}'})
+            return
+        want_ndjson = (query.get('format', [''])[0] == 'ndjson'
+                       or 'application/x-ndjson' in (self.headers.get('Accept') or ''))
+        try:
+            if want_ndjson:
+                self.send_body(200, 'application/x-ndjson', self.service.render_ndjson(data))
+            else:
+                compact = query.get('compact', ['0'])[0] not in ('', '0', 'false')
+                self.send_body(200, 'text/html; charset=utf-8', self.service.render_html(data, compact))
+        except KeyError as e:
+            self.send_json(400, {'error': f'Missing key in input: {e}'})
+        except OSError as e:
+            self.send_json(400, {'error': f'Could not read sources: {e}'})
+
+    def send_json(self, status: int, payload: dict) -> None:
+        self.send_body(status, 'application/json', json.dumps(payload))
+
+    def send_body(self, status: int, content_type: str, body: str) -> None:
+        encoded = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def address_string(self) -> str:
+        # Unix socket peers have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self) -> None:
+        # A socket left behind by a previous run would make bind() fail
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        super().server_bind()
+
+def make_server(service: ReportService, host: str = '127.0.0.1', port: int = 8765,
+                socket_path: Optional[str] = None) -> socketserver.BaseServer:
+    """Creates an HTTP server bound to a Unix socket, or to host and port"""
+    handler = type('BoundReportRequestHandler', (ReportRequestHandler,), {'service': service})
+    if socket_path:
+        return UnixHTTPServer(socket_path, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+def serve(projects_root: str, mapping_file: Optional[str] = None, host: str = '127.0.0.1', port: int = 8765,
+          socket_path: Optional[str] = None, watch_interval: float = 5.0) -> None:
+    service = ReportService(projects_root, load_mapping(mapping_file), watch_interval)
+    service.start()
+    server = make_server(service, host, port, socket_path)
+    where = socket_path or f'http://{host}:{server.server_address[1]}'
+    print(f"Serving reports for {service.projects_root} on {where}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Serve stack trace reports from a long-running process',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        'projects_root',
+        help='Path to the root directory of the projects'
+    )
+    parser.add_argument(
+        '--mapping',
+        help='Optional TOML file containing package prefix to directory mappings'
+    )
+    parser.add_argument(
+        '--host',
+        default='127.0.0.1',
+        help='Address to listen on'
+    )
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=8765,
+        help='Port to listen on'
+    )
+    parser.add_argument(
+        '--socket',
+        help='Listen on this Unix socket instead of host and port'
+    )
+    parser.add_argument(
+        '--watch-interval',
+        type=float,
+        default=5.0,
+        help='Seconds between checks for changed projects'
+    )
+    parser.add_argument(
+        '--parse-cache-mb',
+        type=int,
+        default=DEFAULT_SOURCE_CACHE_BYTES // (1024 * 1024),
+        help='Maximum size in MB of Java sources kept in memory, along with their syntax trees'
+    )
+    args = parser.parse_args()
+    SOURCE_CACHE.set_limit(args.parse_cache_mb * 1024 * 1024)
+    serve(args.projects_root, args.mapping, args.host, args.port, args.socket, args.watch_interval)
@@ -0,0 +1,106 @@
+import os
+import sys
+import json
+import sqlite3
+import threading
+from typing import Dict, Optional, Tuple
+from instrument import count
+
+# Bump whenever snippet extraction changes its output, so that results
+# computed by older versions are discarded
+SNIPPET_CACHE_VERSION = 1
+
+class SnippetCache:
+    """
+    On-disk cache of extracted class and method snippets, keyed by the git
+    blob id of the source file and the line number. Blob ids identify file
+    contents, so entries stay valid across checkouts and are shared by
+    identical files in different projects.
+
+    Every process opens its own connection; the database is in WAL mode so
+    concurrent workers can read while one of them writes.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._migrate()
+
+    def _migrate(self) -> None:
+        with self._lock:
+            connection = self._connection
+            connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            row = connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if row is not None and row[0] == str(SNIPPET_CACHE_VERSION):
+                return
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.execute('DROP TABLE IF EXISTS snippets')
+                connection.execute('''
+                    CREATE TABLE snippets (
+                        blob_id TEXT NOT NULL,
+                        line INTEGER NOT NULL,
+                        class TEXT NOT NULL,
+                        method TEXT NOT NULL,
+                        PRIMARY KEY (blob_id, line)
+                    ) WITHOUT ROWID
+                ''')
+                connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)",
+                                   (str(SNIPPET_CACHE_VERSION),))
+                connection.execute('COMMIT')
+            except sqlite3.Error:
+                connection.execute('ROLLBACK')
+                raise
+
+    def get(self, blob_id: str, line: int) -> Optional[Tuple[dict, dict]]:
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT class, method FROM snippets WHERE blob_id = ? AND line = ?', (blob_id, line)).fetchone()
+        if row is None:
+            self.misses += 1
+            count('snippet_cache.miss')
+            return None
+        self.hits += 1
+        count('snippet_cache.hit')
+        return json.loads(row[0]), json.loads(row[1])
+
+    def put(self, blob_id: str, line: int, snippets: Tuple[dict, dict]) -> None:
+        class_details, method_details = snippets
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO snippets (blob_id, line, class, method) VALUES (?, ?, ?, ?)',
+                (blob_id, line, json.dumps(class_details), json.dumps(method_details)))
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+# Open caches keyed by process id and path, as connections must not be used
+# by processes forked after they were opened
+_SNIPPET_CACHES: Dict[Tuple[int, str], Optional[SnippetCache]] = {}
+_SNIPPET_CACHES_LOCK = threading.Lock()
+
+def get_snippet_cache(path: str) -> Optional[SnippetCache]:
+    """Returns this process' connection to the cache at path, or None if it cannot be opened"""
+    key = (os.getpid(), path)
+    with _SNIPPET_CACHES_LOCK:
+        if key not in _SNIPPET_CACHES:
+            try:
+                _SNIPPET_CACHES[key] = SnippetCache(path)
+            except (OSError, sqlite3.Error) as e:
+                print(f"Could not open snippet cache {path}: {e}", file=sys.stderr)
+                _SNIPPET_CACHES[key] = None
+        return _SNIPPET_CACHES[key]
+
+def clear_caches() -> None:
+    """Closes the snippet caches opened by this process"""
+    with _SNIPPET_CACHES_LOCK:
+        caches = [cache for (pid, _), cache in _SNIPPET_CACHES.items() if pid == os.getpid() and cache is not None]
+        _SNIPPET_CACHES.clear()
+    for cache in caches:
+        cache.close()
@@ -0,0 +1,116 @@
+import os
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+from instrument import count
+
+# Where Maven and Gradle builds keep sources, relative to a module directory
+STANDARD_SOURCE_DIRS = ('src/main/java', 'src/test/java', 'src/main/kotlin', 'src/test/kotlin')
+# Used by modules with none of the standard directories, e.g. Ant or Eclipse layouts
+FLAT_SOURCE_DIR = 'src'
+
+POM_MODULE_PATTERN = re.compile(r'<module>\s*([^<\s]+)\s*</module>')
+# include ':a', ':b:c' / include("a", "b") in settings.gradle(.kts)
+GRADLE_INCLUDE_PATTERN = re.compile(r'^\s*include\b(.*)$', re.MULTILINE)
+GRADLE_PROJECT_PATTERN = re.compile(r'''['"]:?([^'"]+)['"]''')
+
+# Nested multi-module builds deeper than this are left to the walk
+MAX_MODULE_DEPTH = 4
+
+_SOURCE_ROOTS: Dict[str, Tuple[str, ...]] = {}
+_SOURCE_ROOTS_LOCK = threading.Lock()
+
+def read_text(path: str) -> str:
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read()
+    except OSError:
+        return ''
+
+def find_modules(module_dir: str) -> List[str]:
+    """
+    Returns the submodule directories a build declares, relative to
+    module_dir: <module> entries of pom.xml and include entries of
+    settings.gradle or settings.gradle.kts.
+    """
+    modules = POM_MODULE_PATTERN.findall(read_text(os.path.join(module_dir, 'pom.xml')))
+    for settings in ('settings.gradle', 'settings.gradle.kts'):
+        for arguments in GRADLE_INCLUDE_PATTERN.findall(read_text(os.path.join(module_dir, settings))):
+            modules += [name.replace(':', '/') for name in GRADLE_PROJECT_PATTERN.findall(arguments)]
+    # Keep the declaration order, dropping duplicates and paths leaving the project
+    seen = set()
+    result = []
+    for module in modules:
+        module = os.path.normpath(module.strip('/'))
+        if module not in seen and not module.startswith('..'):
+            seen.add(module)
+            result.append(module)
+    return result
+
+def discover_source_roots(project_root: str) -> Tuple[str, ...]:
+    """
+    Returns the existing source directories of a project, relative to it:
+    the standard ones of the project and of every module its build declares.
+    """
+    roots = []
+    pending = [('', 0)]
+    visited = set()
+    while pending:
+        module, depth = pending.pop(0)
+        if module in visited:
+            continue
+        visited.add(module)
+        module_dir = os.path.join(project_root, module)
+        module_roots = [os.path.join(module, source_dir) for source_dir in STANDARD_SOURCE_DIRS
+                        if os.path.isdir(os.path.join(module_dir, source_dir))]
+        if not module_roots and os.path.isdir(os.path.join(module_dir, FLAT_SOURCE_DIR)):
+            module_roots.append(os.path.join(module, FLAT_SOURCE_DIR))
+        roots += module_roots
+        if depth < MAX_MODULE_DEPTH:
+            pending += [(os.path.join(module, child) if module else child, depth + 1)
+                        for child in find_modules(module_dir)]
+    return tuple(roots)
+
+def get_source_roots(project_root: str) -> Tuple[str, ...]:
+    """Returns the source directories of a project, discovering them on first use"""
+    project_root = os.path.abspath(project_root)
+    with _SOURCE_ROOTS_LOCK:
+        roots = _SOURCE_ROOTS.get(project_root)
+    if roots is None:
+        roots = discover_source_roots(project_root)
+        with _SOURCE_ROOTS_LOCK:
+            _SOURCE_ROOTS[project_root] = roots
+    return roots
+
+def clear_source_roots(project_roots: Optional[Iterable[str]] = None) -> None:
+    """Forgets the source directories of the given projects, or of all of them"""
+    with _SOURCE_ROOTS_LOCK:
+        if project_roots is None:
+            _SOURCE_ROOTS.clear()
+        else:
+            for project_root in project_roots:
+                _SOURCE_ROOTS.pop(os.path.abspath(project_root), None)
+
+def clear_caches() -> None:
+    """Forgets the source directories of every project"""
+    clear_source_roots()
+
+def probe_source_roots(project_root: str, expected_suffix: str) -> List[str]:
+    """
+    Looks for expected_suffix directly under each source directory of the
+    project, costing one stat per source directory instead of a tree walk.
+
+    Args:
+        project_root (str): The project directory.
+        expected_suffix (str): Path suffix such as 'io/netty/util/Foo.java'.
+
+    Returns:
+        List[str]: The matching files, main sources before test sources.
+    """
+    matches = []
+    for root in get_source_roots(project_root):
+        path = os.path.join(project_root, root, expected_suffix)
+        if os.path.isfile(path):
+            matches.append(path)
+    count('source_roots.hit' if matches else 'source_roots.miss')
+    return matches
@@ -0,0 +1,141 @@
+import os
+import re
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Any, Dict, List, Tuple
+from gitsource import read_revision_file, split_revision_path
+from instrument import count, span
+
+DEFAULT_SOURCE_CACHE_BYTES = 256 * 1024 * 1024
+
+@dataclass
+class SourceFile:
+    """
+    A source file read once as bytes. Lines are located through byte offsets
+    and only the lines actually used are decoded.
+    """
+    path: str
+    data: bytes
+    # Byte offset at which each (0-based) line starts
+    line_offsets: List[int]
+    # State derived from data by other modules on first use, such as the
+    # syntax tree, dropped together with the file
+    derived: Dict[str, Any] = field(default_factory=dict, repr=False)
+
+    @cached_property
+    def blob_id(self) -> str:
+        """The git blob id of the contents, identifying them across paths and checkouts"""
+        return hashlib.sha1(b'blob %d\0' % len(self.data) + self.data).hexdigest()
+
+    @property
+    def line_count(self) -> int:
+        """The number of lines, counted the way readlines() would"""
+        if not self.data or self.data.endswith(b'\n'):
+            return len(self.line_offsets) - 1
+        return len(self.line_offsets)
+
+    def line_span(self, row: int) -> Tuple[int, int]:
+        """Returns the byte range of a 0-based line, without its newline"""
+        start = self.line_offsets[row]
+        end = self.line_offsets[row + 1] - 1 if row + 1 < len(self.line_offsets) else len(self.data)
+        return start, end
+
+    def line(self, row: int) -> str:
+        """
+        Returns a single 0-based line without its newline, decoding only that
+        line. Bytes that are not UTF-8, as in Latin-1 comments, are replaced
+        like they are in node text rather than failing the whole report.
+        """
+        start, end = self.line_span(row)
+        return self.data[start:end].decode('utf-8', errors='replace')
+
+def compute_line_offsets(data: bytes) -> List[int]:
+    return [0] + [match.end() for match in re.finditer(b'\n', data)]
+
+def load_source(data: bytes, path: str = '') -> SourceFile:
+    if b'\r' in data:
+        # Normalize newlines the same way text mode reads do
+        data = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+    return SourceFile(path=path, data=data, line_offsets=compute_line_offsets(data))
+
+class SourceCache:
+    """
+    LRU cache of source files keyed by path and validated by mtime and size.
+    Paths read at a commit (see gitsource) are served from git and never
+    revalidated.
+
+    The cap applies to the source bytes held by the cache; state derived from
+    them, such as syntax trees, is not counted, so actual memory use is a
+    small multiple of it.
+    """
+    def __init__(self, max_bytes: int = DEFAULT_SOURCE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, Tuple[int, int, SourceFile]] = OrderedDict()
+
+    def get(self, path: str) -> SourceFile:
+        if split_revision_path(path) is not None:
+            return self._get_revision(path)
+        stat = os.stat(path)
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            self.hits += 1
+            count('source_cache.hit')
+            self._entries.move_to_end(path)
+            return entry[2]
+        self.misses += 1
+        count('source_cache.miss')
+        self._evict(path)
+        with span('read_source'), open(path, 'rb') as f:
+            source = load_source(f.read(), path)
+        self._add(path, stat.st_mtime_ns, stat.st_size, source)
+        return source
+
+    def _get_revision(self, path: str) -> SourceFile:
+        """Returns a file read at a commit, which never changes"""
+        entry = self._entries.get(path)
+        if entry is not None:
+            self.hits += 1
+            count('source_cache.hit')
+            self._entries.move_to_end(path)
+            return entry[2]
+        self.misses += 1
+        count('source_cache.miss')
+        self._add(path, 0, 0, load_source(read_revision_file(path), path))
+        return self._entries[path][2]
+
+    def _add(self, path: str, mtime_ns: int, size: int, source: SourceFile) -> None:
+        self._entries[path] = (mtime_ns, size, source)
+        self.total_bytes += len(source.data)
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            self._evict(next(iter(self._entries)))
+
+    def set_limit(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        while self.total_bytes > self.max_bytes and self._entries:
+            self._evict(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.total_bytes = 0
+
+    def _evict(self, path: str) -> None:
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self.total_bytes -= len(entry[2].data)
+
+# Shared by the line check, the parser and snippet extraction, so each file is
+# read from disk once per process
+SOURCE_CACHE = SourceCache()
+
+def read_source(path: str) -> SourceFile:
+    """Returns the cached contents of path, reading it if missing or changed"""
+    return SOURCE_CACHE.get(path)
+
+def clear_caches() -> None:
+    """Drops every source read by this process"""
+    SOURCE_CACHE.clear()
@@ -1,4 +1,4 @@
-HEADER = '''
+HEAD = '''
 <!DOCTYPE html>
 <html lang="en">
   <head>
@@ -9,7 +9,9 @@ HEADER = '''
     <script src="https://cdnjs.cloudflare.com/ajax/libs/highlightjs-line-numbers.js/2.9.0/highlightjs-line-numbers.min.js"></script>
     <script src="https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.3.1/languages/java.min.js"></script>
     <script>hljs.highlightAll();hljs.initLineNumbersOnLoad({singleLine: true});</script>
-    <style>
+    <style>'''
+
+STYLE = '''
     body {
         background: #bcbcbc;
         padding: 0 24px;
@@ -99,10 +101,62 @@ HEADER = '''
     .filepath {
         font-size: 1.2em;
     }
-    </style>
+    .snippet-ref {
+        font-size: 1.1em;
+        font-style: italic;
+    }
+'''
+
+HEADER = HEAD + STYLE + '''    </style>
   </head>
 '''
 
+# Head of compact reports: no CDN scripts, styles come from the shared asset
+# directory and code is highlighted when the report is generated
+COMPACT_HEADER = '''
+<!DOCTYPE html>
+<html lang="en">
+  <head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <link rel="stylesheet" href="{stylesheet}">
+  </head>
+'''
+
+COMPACT_STYLE = STYLE + '''    pre.code {
+        background: #282c34;
+        color: #abb2bf;
+        padding: 8px;
+        overflow-x: auto;
+    }
+    .code .line, .code .fold {
+        display: block;
+    }
+    .code .hl {
+        background: #3e4451;
+    }
+    .code .ln {
+        display: inline-block;
+        width: 40px;
+        margin-right: 10px;
+        text-align: right;
+        color: #5c6370;
+        user-select: none;
+    }
+    .code .fold {
+        color: #5c6370;
+        font-style: italic;
+        user-select: none;
+    }
+    .hljs-keyword { color: #c678dd; }
+    .hljs-string { color: #98c379; }
+    .hljs-comment { color: #5c6370; font-style: italic; }
+    .hljs-number, .hljs-literal { color: #d19a66; }
+    .hljs-type { color: #e6c07b; }
+    .hljs-title { color: #61afef; }
+    .hljs-meta { color: #61aeee; }
+'''
+
 TABLE_HEADER = '''
   <body>
     <div class="table-container">
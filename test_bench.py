@@ -0,0 +1,17 @@
+import tomllib
+from bench import generate_projects, generate_report_input
+from main import iter_report_records
+
+def test_synthetic_report_resolves(tmp_path):
+    projects_root = str(tmp_path / 'projects')
+    frames = generate_projects(projects_root, project_count=2, files_per_project=10, package_depth=3,
+                               methods_per_file=3, large_file_methods=50, seed=7)
+    data = tomllib.loads(generate_report_input(frames, depth=20, seed=7))
+    report, *records = iter_report_records(data, projects_root, snippet_cache=False)
+    assert report['depths'] == [21, 21]
+    statuses = [record['status'] for record in records]
+    # Everything but the JDK frame at the bottom of each stack resolves
+    assert statuses.count('resolved') == 40 and statuses.count('error') == 2
+    for record in records:
+        if record['status'] == 'resolved':
+            assert record['method_span']['start_line'] <= record['line'] <= record['method_span']['end_line']
@@ -0,0 +1,26 @@
+import os
+from file_index import get_file_index, find_indexed_files, get_index_path, load_file_index
+
+def test_find_indexed_files(tmp_path, make_file):
+    project = tmp_path / 'projects' / 'demo'
+    make_file(str(project / 'src/main/java/io/demo/Foo.java'))
+    make_file(str(project / 'src/test/java/io/demo/Foo.java'))
+    make_file(str(project / 'src/main/java/io/other/Foo.java'))
+    make_file(str(project / 'src/main/java/io/demo/BarFoo.java'))
+
+    matches = find_indexed_files(str(project), 'io/demo/Foo.java')
+    assert sorted(os.path.relpath(m, project) for m in matches) == [
+        'src/main/java/io/demo/Foo.java',
+        'src/test/java/io/demo/Foo.java',
+    ]
+    assert os.path.isfile(get_index_path(str(project)))
+
+def test_index_invalidated_by_directory_mtime(tmp_path, make_file):
+    project = tmp_path / 'projects' / 'demo'
+    make_file(str(project / 'src/io/demo/Foo.java'))
+    assert get_file_index(str(project)).find('io/demo/Bar.java') == []
+
+    make_file(str(project / 'src/io/demo/Bar.java'))
+    # The persisted index no longer matches the tree and must be rejected
+    assert load_file_index(str(project)) is None
+    assert len(get_file_index(str(project), rebuild=True).find('io/demo/Bar.java')) == 1
@@ -0,0 +1,40 @@
+from frames import parse_frame, parse_frames
+
+def test_parse_frame_formats():
+    text, data, error = parse_frame('\tat app//io.demo.Cache$Entry.lambda$get$0(Cache.java:42)')
+    assert (text, error) == ('app//io.demo.Cache$Entry.lambda$get$0(Cache.java:42)', None)
+    assert (data.package, data.method, data.filename, data.line_num, data.expected_suffix) == (
+        'io.demo.Cache$Entry', 'lambda$get$0', 'Cache.java', 42, 'io/demo/Cache.java')
+
+    for line in ('java.base/java.lang.Thread.run(Thread.java:829)',
+                 '  > at lib@1.2/java.lang.Thread.run(Thread.java:829))',
+                 'loader/lib@1.2/java.lang.Thread.run(Thread.java:829)'):
+        _text, data, error = parse_frame(line)
+        assert error is None and (data.package, data.line_num) == ('java.lang.Thread', 829)
+
+    # Frames without a line number are unknown rather than invalid
+    for line in ('at java.base/jdk.internal.misc.Unsafe.park(Native Method)',
+                 'io.demo.Cache.get(Unknown Source)', 'io.demo.Cache.get(Cache.java:n/a)'):
+        _text, data, error = parse_frame(line)
+        assert error is None and data.line_num == -1
+    assert parse_frame('io.demo.Cache.get(Unknown Source)')[1].expected_suffix == 'io/demo/Cache.java'
+
+    # The addresses of lambda and hidden classes are not module prefixes
+    for line in ('io.demo.Foo$$Lambda$14/0x0000000800066840.run(Unknown Source)',
+                 'at app//io.demo.Foo$$Lambda$14/1831932724.run(Foo.java)'):
+        _text, data, error = parse_frame(line)
+        assert error is None and (data.package, data.method, data.filename, data.expected_suffix) == (
+            'io.demo.Foo$$Lambda$14', 'run', 'Foo.java', 'io/demo/Foo.java')
+
+def test_parse_frame_errors():
+    assert parse_frame('  ') == ('', None, 'Empty line')
+    assert parse_frame('Caused by') == ('Caused by', None, 'Invalid line format: Caused by')
+    assert parse_frame('get(Cache.java:1)')[2] == 'Invalid method format: get'
+    assert parse_frame('a.B.c(B.java:x)')[2] == 'Invalid file:line format in line: a.B.c(B.java:x)'
+
+def test_parse_frames_buffer():
+    buffer = 'a.B.c(B.java:1)\n\n   \nnot a frame\r\n\tat app//a.B.d(B.java:2)'
+    parsed = list(parse_frames(buffer))
+    assert [text for text, _data, _error in parsed] == ['a.B.c(B.java:1)', 'not a frame', 'app//a.B.d(B.java:2)']
+    assert [data.line_num if data else error for _text, data, error in parsed] == [
+        1, 'Invalid line format: not a frame', 2]
@@ -0,0 +1,53 @@
+import subprocess
+from gitmeta import read_git_metadata, DescribeCache
+
+def git(repo, *args):
+    return subprocess.run(['git', *args], cwd=repo, check=True, capture_output=True, text=True).stdout.strip()
+
+def make_repo(path):
+    path.mkdir()
+    git(path, 'init', '-q')
+    git(path, 'remote', 'add', 'origin', 'https://example.com/demo.git')
+    git(path, '-c', 'user.name=t', '-c', 'user.email=t@t', 'commit', '-q', '--allow-empty', '-m', 'one')
+
+def commit(repo, message):
+    git(repo, '-c', 'user.name=t', '-c', 'user.email=t@t', 'commit', '-q', '--allow-empty', '-m', message)
+
+def expected(repo):
+    return (
+        git(repo, 'config', '--get', 'remote.origin.url'),
+        git(repo, 'describe', '--tags'),
+        git(repo, 'rev-parse', 'HEAD'),
+    )
+
+def test_read_git_metadata_matches_git(tmp_path):
+    repo = tmp_path / 'demo'
+    make_repo(repo)
+    git(repo, '-c', 'user.name=t', '-c', 'user.email=t@t', 'tag', '-a', 'v1.0', '-m', 'release')
+    assert read_git_metadata(str(repo)) == expected(repo)
+
+    git(repo, 'pack-refs', '--all')
+    assert read_git_metadata(str(repo)) == expected(repo)
+
+    commit(repo, 'two')
+    assert read_git_metadata(str(repo)) == expected(repo)
+
+def test_untagged_repo(tmp_path):
+    repo = tmp_path / 'demo'
+    make_repo(repo)
+    assert read_git_metadata(str(repo)) == (
+        'https://example.com/demo.git', '', git(repo, 'rev-parse', 'HEAD'))
+
+def test_describe_cache_keyed_by_head(tmp_path):
+    repo = tmp_path / 'demo'
+    make_repo(repo)
+    git(repo, 'tag', 'v1.0')
+    commit(repo, 'two')
+    cache = DescribeCache(str(tmp_path / 'cache.json'))
+    assert read_git_metadata(str(repo), cache)[1] == git(repo, 'describe', '--tags')
+    cache.save()
+
+    reloaded = DescribeCache(str(tmp_path / 'cache.json'))
+    assert read_git_metadata(str(repo), reloaded)[1] == git(repo, 'describe', '--tags')
+    commit(repo, 'three')
+    assert read_git_metadata(str(repo), reloaded)[1] == git(repo, 'describe', '--tags')
@@ -0,0 +1,94 @@
+import os
+import subprocess
+from frames import parse_frame
+from gitsource import Pin, find_revision_files, get_revision_path, read_revision_file, resolve_revisions, split_revision_path
+from main import process_line
+from sources import SourceCache
+
+def git(cwd, *args):
+    return subprocess.run(['git', '-c', 'user.name=t', '-c', 'user.email=t@t', *args], cwd=cwd, check=True,
+                          capture_output=True, text=True).stdout.strip()
+
+def make_repo(project):
+    path = project / 'src/main/java/io/demo/Foo.java'
+    os.makedirs(path.parent)
+    git(project, 'init', '-q')
+    path.write_text('package io.demo;\nclass Foo {\n    void old() {}\n}\n')
+    git(project, 'add', '.')
+    git(project, 'commit', '-q', '-m', 'first')
+    git(project, 'tag', 'v1')
+    path.write_text('package io.demo;\nclass Foo {\n    void current() {}\n}\n')
+    (project / 'src/main/java/io/demo/Bar.java').write_text('package io.demo;\nclass Bar {}\n')
+    git(project, 'add', '.')
+    git(project, 'commit', '-q', '-m', 'second')
+    return git(project, 'rev-parse', 'v1')
+
+def test_read_files_at_commit(tmp_path):
+    project = tmp_path / 'projects' / 'demo'
+    os.makedirs(project)
+    commit = make_repo(project)
+    assert resolve_revisions(str(tmp_path / 'projects'), {'demo': 'v1'}) == (Pin('demo', commit),)
+
+    path = get_revision_path(str(project), commit, 'src/main/java/io/demo/Foo.java')
+    assert split_revision_path(path) == (str(project), commit, 'src/main/java/io/demo/Foo.java')
+    assert split_revision_path(str(project / 'Foo.java')) is None
+    assert find_revision_files(str(project), commit, 'io/demo/Foo.java') == [path]
+    assert find_revision_files(str(project), commit, 'io/demo/Bar.java') == []
+    assert b'old()' in read_revision_file(path)
+    assert SourceCache().get(path).line(2) == '    void old() {}'
+
+def test_process_line_at_commit(tmp_path):
+    projects_root = tmp_path / 'projects'
+    project = projects_root / 'demo'
+    os.makedirs(project)
+    commit = make_repo(project)
+    _text, data, _error = parse_frame('io.demo.Foo.old(Foo.java:3)')
+
+    located, error = process_line(str(projects_root), data)
+    assert error is None and located.line_of_code == '    void current() {}'
+    located, error = process_line(str(projects_root), data, revisions=(Pin('demo', commit),))
+    assert error is None and located.line_of_code == '    void old() {}'
+    assert located.filepath == get_revision_path(str(project), commit, 'src/main/java/io/demo/Foo.java')
+
+def test_ambiguous_files_at_commit_use_package_declarations(tmp_path):
+    projects_root = tmp_path / 'projects'
+    project = projects_root / 'demo'
+    os.makedirs(project)
+    commit = make_repo(project)
+    # A relocated copy, listed before the real source, added after the pinned commit
+    shaded = project / 'z-shaded/io/demo/Foo.java'
+    os.makedirs(shaded.parent)
+    shaded.write_text('package shaded.io.demo;\nclass Foo {\n    void shaded() {}\n}\n')
+    git(project, 'add', '.')
+    git(project, 'commit', '-q', '-m', 'shade')
+    head = git(project, 'rev-parse', 'HEAD')
+    _text, data, _error = parse_frame('io.demo.Foo.old(Foo.java:3)')
+
+    for pinned, line in ((head, '    void current() {}'), (commit, '    void old() {}')):
+        located, error = process_line(str(projects_root), data, revisions=(Pin('demo', pinned),))
+        assert error is None and located.line_of_code == line
+        assert located.filepath == get_revision_path(str(project), pinned, 'src/main/java/io/demo/Foo.java')
+
+def test_unresolved_revision_fails_only_its_project(tmp_path):
+    projects_root = tmp_path / 'projects'
+    os.makedirs(projects_root / 'demo')
+    make_repo(projects_root / 'demo')
+    os.makedirs(projects_root / 'plain/src/main/java/io/plain')
+    (projects_root / 'plain/src/main/java/io/plain/Baz.java').write_text('package io.plain;\nclass Baz {}\n')
+
+    revisions = resolve_revisions(str(projects_root), {'demo': 'nope', 'plain': 'HEAD'})
+    assert [pin.error.split(':')[0] for pin in revisions] == ['Error reading demo at nope',
+                                                              'Error reading plain at HEAD']
+    _text, data, _error = parse_frame('io.demo.Foo.old(Foo.java:3)')
+    located, error = process_line(str(projects_root), data, revisions=revisions)
+    assert located is None and error.startswith('Error reading demo at nope')
+
+def test_revisions_cannot_desync_cat_file(tmp_path):
+    project = tmp_path / 'projects' / 'demo'
+    os.makedirs(project)
+    commit = make_repo(project)
+    for revision in ('v1\nHEAD', 'v1 HEAD', 'v1\x00', ''):
+        pin, = resolve_revisions(str(tmp_path / 'projects'), {'demo': revision})
+        assert pin.error == f"Error reading demo at {revision}: Invalid revision {revision!r}"
+    # The pipe is still in step after the rejected revisions
+    assert resolve_revisions(str(tmp_path / 'projects'), {'demo': 'v1'}) == (Pin('demo', commit),)
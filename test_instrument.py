@@ -0,0 +1,32 @@
+import json
+import instrument
+
+def test_spans_counters_and_trace(tmp_path, monkeypatch):
+    monkeypatch.setattr(instrument, '_ENABLED', False)
+    monkeypatch.setattr(instrument, '_TRACE', False)
+    instrument.reset()
+    instrument.enable(trace=True)
+
+    @instrument.timed('work')
+    def work():
+        with instrument.span('inner'):
+            instrument.count('items', 2)
+
+    work()
+    work()
+    summary = instrument.format_summary()
+    assert [line.split()[:2] for line in summary.splitlines() if line.startswith(('work', 'inner', 'items'))] == [
+        ['work', '2'], ['inner', '2'], ['items', '4']]
+
+    trace_file = tmp_path / 'trace.json'
+    instrument.write_chrome_trace(str(trace_file))
+    events = json.loads(trace_file.read_text())['traceEvents']
+    assert sorted(event['name'] for event in events) == ['inner', 'inner', 'work', 'work']
+    assert all(event['ph'] == 'X' and event['dur'] >= 0 for event in events)
+    instrument.reset()
+
+def test_disabled_by_default():
+    assert not instrument.is_enabled()
+    with instrument.span('ignored'):
+        instrument.count('ignored')
+    assert 'ignored' not in instrument.format_summary()
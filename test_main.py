@@ -0,0 +1,147 @@
+import io
+import os
+import subprocess
+import sys
+from concurrent.futures import Executor, Future
+from main import (CellRenderer, Frame, LineData, expand_inputs, fold_lines, get_batch_output_paths,
+                  iter_report_records, iter_snippets, output_code, write_resolved)
+from records import frame_record
+
+def make_frame(method, line_num):
+    data = LineData(
+        filename='Foo.java',
+        filepath='/projects/demo/src/io/demo/Foo.java',
+        package='io.demo.Foo',
+        method=method,
+        line_num=line_num,
+        expected_suffix='io/demo/Foo.java',
+        line_of_code='',
+        project_dir='demo',
+    )
+    return Frame(line=f'io.demo.Foo.{method}(Foo.java:{line_num})', data=data)
+
+def make_record(frame, snippets):
+    return frame_record(frame, snippets, '/projects', 0, 0)
+
+def test_renderer_emits_each_snippet_once():
+    renderer = CellRenderer('/projects')
+    class_details = {'start_line': 1, 'declaration_line': 1, 'content': 'class Foo {\n'}
+    run_details = {'start_line': 3, 'declaration_line': 3, 'content': 'void run() {}\n'}
+    stop_details = {'start_line': 5, 'declaration_line': 5, 'content': 'void stop() {}\n'}
+
+    first = renderer.render(make_record(make_frame('run', 3), (class_details, run_details)))
+    repeat = renderer.render(make_record(make_frame('run', 3), (class_details, run_details)))
+    other = renderer.render(make_record(make_frame('stop', 5), (class_details, stop_details)))
+
+    assert first.count('<pre id="snippet-') == 2
+    assert 'void run()' not in repeat
+    assert repeat.count('href="#snippet-1"') == 1 and repeat.count('href="#snippet-2"') == 1
+    # The class snippet is shared, the new method is emitted in full
+    assert 'href="#snippet-1"' in other and '<pre id="snippet-3">' in other
+
+def test_renderer_shares_highlighted_snippets_by_line():
+    renderer = CellRenderer('/projects')
+    class_details = {'start_line': 1, 'declaration_line': 1, 'content': 'class Foo {\n'}
+    run_details = {'start_line': 3, 'declaration_line': 3, 'content': 'void run() {\n  a();\n  b();\n}\n'}
+    cells = []
+    for line_num in (4, 5, 5):
+        record = make_record(make_frame('run', line_num), (class_details, run_details))
+        record['highlighted'] = {'class': ['class Foo {'], 'method': run_details['content'].splitlines()}
+        cells.append(renderer.render(record))
+    # The method is short enough not to be folded, yet each frame marks its own line
+    assert '<span class="line hl"><span class="ln">4</span>' in cells[0]
+    assert '<span class="line hl"><span class="ln">5</span>' in cells[1]
+    assert '<pre id="snippet-' not in cells[2] and cells[2].count('href="#snippet-3"') == 1
+
+def test_renderer_error_and_unknown_cells():
+    renderer = CellRenderer('/projects')
+    error = make_record(Frame(line='bad', error='Invalid line format: bad'), None)
+    assert error['error_category'] == 'invalid_frame'
+    assert '<strong>Error</strong>' in renderer.render(error)
+    unknown = make_record(make_frame('run', -1), None)
+    assert unknown['status'] == 'unknown'
+    assert 'Unknown line' in renderer.render(unknown)
+
+def test_frame_record_spans():
+    class_details = {'start_line': 1, 'declaration_line': 2, 'content': '/** Doc */\nclass Foo {\n'}
+    method_details = {'start_line': None, 'declaration_line': None, 'content': 'None\n'}
+    record = make_record(make_frame('run', 3), (class_details, method_details))
+    assert record['status'] == 'resolved'
+    assert record['path'] == 'demo/src/io/demo/Foo.java'
+    assert record['class_span'] == {'start_line': 1, 'end_line': 2, 'declaration_line': 2,
+                                    'content': class_details['content']}
+    assert record['method_span'] is None
+
+def test_fold_lines_keeps_declaration_and_window():
+    details = {'start_line': 10, 'declaration_line': 12}
+    lines = [f'line {n}' for n in range(10, 40)]
+    keep = fold_lines(details, lines, focus_line=30, context=2)
+    assert keep == [2, 18, 19, 20, 21, 22]
+    assert fold_lines(details, lines[:6], focus_line=12, context=2) is None
+
+    html = output_code(10, lines, keep, focus_line=30)
+    assert html.count('class="fold"') == 3
+    assert '<span class="line hl"><span class="ln">30</span>line 30</span>' in html
+
+def test_import_defers_parser_and_pool():
+    code = "import main, sys; print(sorted({'tree_sitter', 'multiprocessing'} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '[]'
+
+def test_resolve_only(tmp_path):
+    source = tmp_path / 'demo/src/main/java/io/demo/Foo.java'
+    source.parent.mkdir(parents=True)
+    source.write_text('package io.demo;\n\nclass Foo {\n    void run() {\n    }\n}\n')
+    data = {'originating_test': 'io.demo.FooTest#run', 'algorithm': 'test', 'field_declaration': 'int x;',
+            'stacks': (['io.demo.Foo.run(Foo.java:4)', 'io.demo.Foo.run(Native Method)'], ['io.demo.Bar.run(Bar.java:1)'])}
+    records = list(iter_report_records(data, str(tmp_path), snippets=False))
+    assert records[1]['class_span'] is None and records[1]['line_of_code'] == '    void run() {'
+
+    out = io.StringIO()
+    write_resolved(out, iter(records))
+    assert out.getvalue().splitlines() == [
+        '0\t0\tresolved\tdemo/src/main/java/io/demo/Foo.java:4',
+        "1\t0\terror\tNo file found ending with 'io/demo/Bar.java'",
+        '0\t1\tunknown\tio.demo.Foo.run(Native Method)',
+    ]
+
+def test_non_utf8_source(tmp_path):
+    source = tmp_path / 'demo/src/main/java/io/demo/Foo.java'
+    source.parent.mkdir(parents=True)
+    source.write_bytes('package io.demo;\n\nclass Foo {\n    /** Größe */\n    void run() {\n    }\n}\n'.encode('latin-1'))
+    data = {'originating_test': 'io.demo.FooTest#run', 'algorithm': 'test', 'field_declaration': 'int x;',
+            'stacks': (['io.demo.Foo.run(Foo.java:5)'], [])}
+    records = list(iter_report_records(data, str(tmp_path)))
+    assert records[1]['status'] == 'resolved' and records[1]['line_of_code'] == '    void run() {'
+    # Undecodable bytes are replaced rather than failing the report
+    assert records[1]['method_span']['content'].startswith('    /** Gr\ufffd\ufffde */\n')
+
+def test_batch_outputs_mirror_input_tree(tmp_path):
+    for path in ('in/a.toml', 'in/sub/a.toml', 'in/sub/deeper/b.toml'):
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text('')
+    out = str(tmp_path / 'out')
+    inputs = str(tmp_path / 'in/**/*.toml')
+    assert get_batch_output_paths(expand_inputs(inputs), inputs, out, '.html') == [
+        os.path.join(out, 'a.html'), os.path.join(out, 'sub/a.html'), os.path.join(out, 'sub/deeper/b.html')]
+    inputs = str(tmp_path / 'in/sub')
+    assert get_batch_output_paths(expand_inputs(inputs), inputs, out, '.ndjson') == [os.path.join(out, 'a.ndjson')]
+
+class RecordingExecutor(Executor):
+    """Runs tasks when submitted, recording how many were submitted"""
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, fn, *args):
+        self.submitted += 1
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+def test_iter_snippets_bounds_frames_in_flight():
+    frames = [Frame(line=f'frame {i}', data=None, error='Invalid line format') for i in range(100)]
+    executor = RecordingExecutor()
+    snippets = iter_snippets(frames, executor)
+    assert next(snippets) is None and executor.submitted == 2
+    assert list(snippets) == [None] * 99 and executor.submitted == 100
@@ -0,0 +1,38 @@
+from frames import parse_frame
+from main import process_line
+from package_index import HEAD_BYTES, find_declaring_files, get_package_index, read_declarations
+
+LICENSE = '/*\n' + ' * Licensed under the Apache License, Version 2.0.\n' * 20 + ' */\n'
+
+def test_read_declarations(tmp_path, make_file):
+    path = str(tmp_path / 'Foo.java')
+    make_file(path, LICENSE + 'package io.demo;\n\nimport java.util.List;\n\n'
+                    'public final class Foo {\n    static class Nested {}\n}\n\nclass Helper {}\n')
+    assert read_declarations(path) == ('io.demo', ['Foo', 'Helper'])
+
+def test_read_declarations_across_head_boundary(tmp_path, make_file):
+    path = str(tmp_path / 'DefaultPromise.java')
+    # The first read ends right after 'package i'
+    header = '/*' + ' ' * (HEAD_BYTES - 14) + '*/\n'
+    make_file(path, header + 'package io.netty.util.concurrent;\n\npublic class DefaultPromise {}\n')
+    assert len(header) + len('package i') == HEAD_BYTES
+    assert read_declarations(path) == ('io.netty.util.concurrent', ['DefaultPromise'])
+
+def test_ambiguous_matches_use_package_declarations(tmp_path, make_file):
+    projects_root = tmp_path / 'projects'
+    project = projects_root / 'demo'
+    # A relocated copy, walked before the real source, and a file outside its package's directory
+    make_file(str(project / 'a-shaded/io/demo/Foo.java'), 'package shaded.io.demo;\nclass Foo {}\n')
+    make_file(str(project / 'core/io/demo/Foo.java'), LICENSE + 'package io.demo;\nclass Foo {\n}\n')
+    make_file(str(project / 'core/Bar.java'), 'package io.demo;\nclass Bar {\n}\n')
+
+    index = get_package_index(str(project))
+    assert index.find_class('io.demo.Foo$Inner$1') == [str(project / 'core/io/demo/Foo.java')]
+    assert find_declaring_files(str(project), 'io.demo.Bar', 'Bar.java') == [str(project / 'core/Bar.java')]
+
+    _text, data, _error = parse_frame('io.demo.Foo$1.lambda$run$0(Foo.java:23)')
+    located, error = process_line(str(projects_root), data)
+    assert error is None and located.filepath == str(project / 'core/io/demo/Foo.java')
+    _text, data, _error = parse_frame('io.demo.Bar.run(Bar.java:2)')
+    located, error = process_line(str(projects_root), data)
+    assert error is None and located.filepath == str(project / 'core/Bar.java')
@@ -0,0 +1,36 @@
+from projects import PackageTrie, ProjectDirectories, build_name_lookup, match_project_name
+
+def test_longest_prefix_wins():
+    trie = PackageTrie({
+        'org.eclipse': 'eclipse',
+        'org.eclipse.jetty': 'jetty.project',
+        'io.vlingo.xoom.actors': 'xoom-actors',
+    })
+    assert trie.longest_match('org.eclipse.jetty.util.BufferUtil') == 'jetty.project'
+    assert trie.longest_match('org.eclipse.core.Foo') == 'eclipse'
+    assert trie.longest_match('io.vlingo.xoom.Other') is None
+    # Prefixes match whole package segments only
+    assert trie.longest_match('org.eclipsex.Foo') is None
+
+def test_nested_tables_are_flattened():
+    trie = PackageTrie({'org': {'apache': {'commons': 'commons-lang'}}})
+    assert trie.longest_match('org.apache.commons.lang3.StringUtils') == 'commons-lang'
+
+def test_match_project_name():
+    lookup = build_name_lookup(['Netty', 'lettuce', 'netty'])
+    assert match_project_name('io.netty.util.concurrent.DefaultPromise', lookup) == 'Netty'
+    assert match_project_name('io.lettuce.core.RedisClient', lookup) == 'lettuce'
+    assert match_project_name('java.lang.Thread', lookup) is None
+
+def test_project_directories(tmp_path):
+    (tmp_path / 'netty').mkdir()
+    (tmp_path / 'README.md').write_text('')
+    directories = ProjectDirectories(str(tmp_path))
+    assert directories.names == ('netty',)
+    assert not directories.is_stale()
+
+    (tmp_path / 'Lettuce').mkdir()
+    assert directories.is_stale()
+    directories.refresh()
+    assert sorted(directories.names) == ['Lettuce', 'netty']
+    assert directories.lookup['lettuce'] == 'Lettuce'
@@ -0,0 +1,52 @@
+from rvlog import iter_races
+
+LOG = '''\
+Data race on field java.util.ArrayList.size: {{{
+    Concurrent write in thread T10 (locks held: {Monitor@67298f15})
+ ---->  at java.util.ArrayList.add(ArrayList.java:459)
+        at io.demo.Worker.run(Worker.java:12)
+    T10 is created by T1
+        at io.demo.Main.main(Main.java:5)
+
+    Concurrent read in thread T11 (locks held: {})
+ ---->  at java.util.ArrayList.size(ArrayList.java:277)
+    T11 is created by T1
+        at io.demo.Main.main(Main.java:6)
+}}}
+Read in thread T2
+  > at io.demo.Cache.get(Cache.java:30)
+Thread T2 is created by T1
+Write in thread T3
+  > at io.demo.Cache.put(Cache.java:40)
+Thread T3 is created by T1
+Read in thread T4
+  > at io.demo.Cache.get(Cache.java:31)
+'''
+
+def test_iter_races_splits_log():
+    races = list(iter_races(LOG.splitlines(keepends=True)))
+
+    assert [race.index for race in races] == [1, 2, 3]
+    assert races[0].description == 'field java.util.ArrayList.size'
+    assert [(access.kind, access.thread) for access in races[0].accesses] == [('write', 'T10'), ('read', 'T11')]
+    # Thread creation stacks are not part of the accesses
+    assert races[0].stacks == (
+        ['at java.util.ArrayList.add(ArrayList.java:459)', '        at io.demo.Worker.run(Worker.java:12)'],
+        ['at java.util.ArrayList.size(ArrayList.java:277)'],
+    )
+    # Without headers, a third access starts the next race
+    assert races[1].stacks == (['at io.demo.Cache.get(Cache.java:30)'], ['at io.demo.Cache.put(Cache.java:40)'])
+    assert races[2].stacks == (['at io.demo.Cache.get(Cache.java:31)'], [])
+
+def test_iter_races_is_lazy():
+    consumed = []
+
+    def lines():
+        for line in LOG.splitlines(keepends=True):
+            consumed.append(line)
+            yield line
+
+    races = iter_races(lines())
+    next(races)
+    # The first race is yielded once its closing braces are read
+    assert consumed[-1] == '}}}\n'
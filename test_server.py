@@ -0,0 +1,97 @@
+import json
+import subprocess
+import threading
+import tomllib
+import urllib.request
+from server import ReportService, make_server
+
+SOURCE = '''package io.demo;
+
+public class Foo {
+    void run() {
+        int x = 1;
+    }
+}
+'''
+
+INPUT = '''originating_test = "io.demo.FooTest"
+algorithm = "demo"
+field_declaration = "int x;"
+stack_trace = """
+==================Stack Trace==================
+io.demo.Foo.run(Foo.java:5))
+\tio.demo.Foo.run(Foo.java:5))
+"""
+'''
+
+def make_projects(tmp_path):
+    source = tmp_path / 'projects' / 'demo' / 'src' / 'io' / 'demo' / 'Foo.java'
+    source.parent.mkdir(parents=True)
+    source.write_text(SOURCE)
+    return tmp_path / 'projects'
+
+def post(url, body):
+    request = urllib.request.Request(url, data=body.encode('utf-8'), method='POST')
+    with urllib.request.urlopen(request) as response:
+        return response.read().decode('utf-8')
+
+def test_server_reports(tmp_path):
+    service = ReportService(str(make_projects(tmp_path)))
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    try:
+        report, *frames = map(json.loads, post(f'{base}/report?format=ndjson', INPUT).splitlines())
+        assert report['depths'] == [1, 1]
+        assert [(frame['stack'], frame['depth']) for frame in frames] == [(0, 0), (1, 0)]
+        assert frames[0]['path'] == 'demo/src/io/demo/Foo.java'
+        assert frames[0]['method_span']['start_line'] == 4
+        assert 'int x = 1;' in post(f'{base}/report', INPUT)
+        # A project that cannot be read at its pinned revision only fails its own frames
+        _report, *frames = map(json.loads, post(f'{base}/report?format=ndjson',
+                                                INPUT + '[commits]\ndemo = "v1"\n').splitlines())
+        assert [frame['error_category'] for frame in frames] == ['read_error', 'read_error']
+        with urllib.request.urlopen(f'{base}/health') as response:
+            assert json.load(response)['reports'] == 3
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_new_project_invalidates_caches(tmp_path):
+    projects = make_projects(tmp_path)
+    service = ReportService(str(projects))
+    assert not service.check_for_changes()
+    (projects / 'other').mkdir()
+    assert service.check_for_changes()
+    assert 'other' in service.directories.names
+
+def test_commit_invalidates_probed_frames(tmp_path):
+    project = tmp_path / 'projects' / 'demo'
+    source = project / 'src' / 'main' / 'java' / 'io' / 'demo' / 'Foo.java'
+    source.parent.mkdir(parents=True)
+    source.write_text(SOURCE)
+
+    def git(*args):
+        subprocess.run(['git', '-c', 'user.name=t', '-c', 'user.email=t@t', *args], cwd=project, check=True,
+                       capture_output=True)
+
+    git('init', '-q')
+    git('add', '.')
+    git('commit', '-q', '-m', 'first')
+    report = INPUT.replace('Foo.java:5))\n\t', 'Foo.java:3))\n\t').replace('\tio.demo.Foo.run(Foo.java:5)',
+                                                                         '\tio.demo.Foo.run(Foo.java:9)')
+    service = ReportService(str(tmp_path / 'projects'))
+
+    def located():
+        _report, *frames = map(json.loads, service.render_ndjson(tomllib.loads(report)).splitlines())
+        return [frame['line_of_code'] if frame['status'] == 'resolved' else frame['error_category']
+                for frame in frames]
+
+    assert located() == ['public class Foo {', 'line_out_of_range']
+    # The frames were found by probing src/main/java, so no file index was loaded to go stale
+    source.write_text('package io.demo;\n\n// Foo\npublic class Foo {\n    void run() {\n'
+                      '        int y = 2;\n        int x = 1;\n    }\n}\n')
+    git('commit', '-q', '-am', 'second')
+    assert service.check_for_changes()
+    assert located() == ['// Foo', '}']
+    assert not service.check_for_changes()
@@ -0,0 +1,28 @@
+import snippet_cache
+from snippet_cache import SnippetCache
+
+SNIPPETS = (
+    {'start_line': 1, 'declaration_line': 1, 'content': 'class Größe {\n'},
+    {'start_line': None, 'declaration_line': None, 'content': 'None\n'},
+)
+
+def test_snippet_cache_round_trip(tmp_path):
+    path = str(tmp_path / 'index' / 'snippets.sqlite')
+    cache = SnippetCache(path)
+    assert cache.get('abc', 3) is None
+    cache.put('abc', 3, SNIPPETS)
+    cache.close()
+
+    reopened = SnippetCache(path)
+    assert reopened.get('abc', 3) == SNIPPETS
+    assert reopened.get('abc', 4) is None
+    assert (reopened.hits, reopened.misses) == (1, 1)
+
+def test_version_change_discards_entries(tmp_path, monkeypatch):
+    path = str(tmp_path / 'snippets.sqlite')
+    cache = SnippetCache(path)
+    cache.put('abc', 3, SNIPPETS)
+    cache.close()
+
+    monkeypatch.setattr(snippet_cache, 'SNIPPET_CACHE_VERSION', snippet_cache.SNIPPET_CACHE_VERSION + 1)
+    assert SnippetCache(path).get('abc', 3) is None
@@ -0,0 +1,33 @@
+import os
+from file_index import build_file_index
+from source_roots import discover_source_roots, find_modules, probe_source_roots
+
+def test_modules_from_maven_and_gradle(tmp_path, make_file):
+    make_file(str(tmp_path / 'pom.xml'), '<modules>\n  <module>common</module>\n  <module> codec </module>\n</modules>\n')
+    make_file(str(tmp_path / 'settings.gradle'), "include ':transport:native', 'common'\ninclude('docs')\n")
+    assert find_modules(str(tmp_path)) == ['common', 'codec', 'transport/native', 'docs']
+
+def test_probe_source_roots(tmp_path, make_file):
+    project = tmp_path / 'demo'
+    make_file(str(project / 'pom.xml'), '<module>core</module>')
+    make_file(str(project / 'core/pom.xml'), '<module>api</module>')
+    make_file(str(project / 'core/api/src/main/java/io/demo/Foo.java'))
+    make_file(str(project / 'core/api/src/test/java/io/demo/Foo.java'))
+    make_file(str(project / 'core/target/classes/io/demo/Foo.java'))
+
+    assert discover_source_roots(str(project)) == ('core/api/src/main/java', 'core/api/src/test/java')
+    matches = probe_source_roots(str(project), 'io/demo/Foo.java')
+    assert [os.path.relpath(m, project) for m in matches] == [
+        'core/api/src/main/java/io/demo/Foo.java',
+        'core/api/src/test/java/io/demo/Foo.java',
+    ]
+
+def test_walk_skips_build_outputs_outside_source_roots(tmp_path, make_file):
+    project = tmp_path / 'demo'
+    make_file(str(project / 'src/main/java/org/gradle/build/Foo.java'))
+    make_file(str(project / 'target/generated/org/gradle/build/Foo.java'))
+    make_file(str(project / 'node_modules/x/Foo.java'))
+    make_file(str(project / 'tools/Foo.java'))
+
+    index = build_file_index(str(project))
+    assert sorted(index.files['Foo.java']) == ['src/main/java/org/gradle/build/Foo.java', 'tools/Foo.java']
@@ -0,0 +1,27 @@
+from sources import SourceCache, load_source
+
+SOURCE = 'class A {\n    int x;\n}\n'
+
+def test_source_cache(tmp_path):
+    first = tmp_path / 'First.java'
+    second = tmp_path / 'Second.java'
+    first.write_text(SOURCE)
+    second.write_text(SOURCE)
+
+    cache = SourceCache(max_bytes=len(SOURCE) + 1)
+    source = cache.get(str(first))
+    assert cache.get(str(first)) is source
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Only one file fits under the cap, so the least recently used is evicted
+    cache.get(str(second))
+    assert cache.total_bytes == len(SOURCE)
+    assert cache.get(str(first)) is not source
+    assert cache.misses == 3
+
+def test_lines_match_readlines():
+    for text in ('', 'a', 'a\n', 'a\nb', 'a\r\nb\r\n', '\n\n', 'ä\nß\n'):
+        lines = text.replace('\r\n', '\n').splitlines()
+        source = load_source(text.encode('utf-8'))
+        assert source.line_count == len(lines)
+        assert [source.line(row) for row in range(source.line_count)] == lines
@@ -96,13 +96,74 @@ public final class ThreadExecutorMap {
 }
 """
 
-from ts import find_class_declaration_and_method
+from ts import find_class_declaration_and_method, highlight_source
 from pprint import pprint
+import html
+import re
 
 def test_find_class_declaration_and_method():
     class_details, method_details = find_class_declaration_and_method(SOURCE, 74)
     pprint(class_details)
     pprint(method_details)
+    assert class_details['start_line'] == 24
+    assert class_details['content'].endswith('public final class ThreadExecutorMap {\n')
+    assert method_details['start_line'] == 62
+    assert 'public static Runnable apply(final Runnable command' in method_details['content']
+
+CONSTRUCTS = """package demo;
+
+public enum Mode {
+    FAST;
+
+    static final Runnable HOOK = () -> {
+        System.out.println("hook");
+    };
+
+    Mode() {
+        init();
+    }
+}
+"""
+
+def test_find_enclosing_constructs():
+    class_details, method_details = find_class_declaration_and_method(CONSTRUCTS, 11)
+    assert class_details['content'] == 'public enum Mode {\n'
+    assert method_details['start_line'] == 10
+    assert method_details['content'].startswith('Mode() {')
+
+    _, lambda_details = find_class_declaration_and_method(CONSTRUCTS, 7)
+    assert lambda_details['start_line'] == 6
+    assert lambda_details['content'].startswith('() -> {')
+
+NON_ASCII = """package demo;
+
+// Größenprüfung für Übergänge
+@Note("{")
+class Größe {
+    /** 计算大小 */
+    int größe(String s) { // ä
+        return s.length();
+    }
+}
+"""
+
+def test_non_ascii_source():
+    class_details, method_details = find_class_declaration_and_method(NON_ASCII, 8)
+    assert class_details['content'] == '@Note("{")\nclass Größe {\n'
+    assert method_details['start_line'] == 6
+    assert method_details['content'] == (
+        '    /** 计算大小 */\n'
+        'int größe(String s) { // ä\n'
+        '        return s.length();\n'
+        '    }\n'
+    )
+
+def test_highlight_source_preserves_text():
+    rows = highlight_source(SOURCE)
+    plain = [html.unescape(re.sub('<[^>]+>', '', row)) for row in rows]
+    assert plain == SOURCE.split('\n')
+    assert '<span class="hljs-title">currentExecutor</span>' in rows[35]
+    assert rows[0] == '<span class="hljs-comment">/*</span>'
 
 if __name__ == "__main__":
     test_find_class_declaration_and_method()
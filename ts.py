@@ -1,16 +1,74 @@
-import re
-import tree_sitter_java as tsj
-from tree_sitter import Language, Parser
-from typing import Optional, Tuple
+from __future__ import annotations
 
-JAVA_LANGUAGE = Language(tsj.language())
+import functools
+import html
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+from sources import SourceFile, load_source, read_source
+from instrument import timed
+
+if TYPE_CHECKING:
+    from tree_sitter import Node, Parser, Tree
+
+@functools.cache
+@timed('tree_sitter.load')
+def get_parser() -> Parser:
+    """
+    Returns the Java parser, loading tree-sitter on first use so that runs
+    which never extract a snippet do not pay for it.
+
+    A single parser is reused for every file; parsing is not reentrant so it
+    must not be shared between threads.
+    """
+    import tree_sitter_java as tsj
+    from tree_sitter import Language, Parser
+    return Parser(Language(tsj.language()))
+
+CLASS_NODE_TYPES = {'class_declaration', 'enum_declaration', 'interface_declaration', 'record_declaration'}
+METHOD_NODE_TYPES = {'method_declaration', 'constructor_declaration'}
+
+@dataclass
+class ParsedSource:
+    file: SourceFile
+    tree: Tree
+    # Snippets already extracted from this file, keyed by line number
+    snippets: Dict[int, Tuple[dict, dict]] = field(default_factory=dict)
+
+    @property
+    def source(self) -> bytes:
+        return self.file.data
+
+    @property
+    def line_offsets(self) -> List[int]:
+        return self.file.line_offsets
+
+    def line(self, row: int) -> str:
+        return self.file.line(row)
+
+@timed('tree_sitter.parse')
+def parse_source_file(source_file: SourceFile) -> ParsedSource:
+    return ParsedSource(
+        file=source_file,
+        tree=get_parser().parse(source_file.data),
+    )
+
+def parse_source(source: bytes) -> ParsedSource:
+    return parse_source_file(load_source(source))
+
+def get_parsed_source(path: str) -> ParsedSource:
+    """Returns the parsed contents of path, parsing the cached source on first use"""
+    source_file = read_source(path)
+    parsed = source_file.derived.get('parsed')
+    if parsed is None:
+        parsed = source_file.derived['parsed'] = parse_source_file(source_file)
+    return parsed
 
 # Function to find class and method declarations based on line number
 def find_class_declaration_and_method(source_code, line_number) -> Tuple[dict, dict]:
-    parser = Parser(JAVA_LANGUAGE)
-    tree = parser.parse(source_code.encode())
+    return find_declarations(parse_source(source_code.encode()), line_number)
 
-    root_node = tree.root_node
+@timed('tree_sitter.query')
+def find_declarations(parsed: ParsedSource, line_number: int) -> Tuple[dict, dict]:
     class_declaration = None
     method_declaration = None
     class_javadoc = None
@@ -19,94 +77,121 @@ def find_class_declaration_and_method(source_code, line_number) -> Tuple[dict, d
     method_start_line = None
     class_jd_start_line = None
     method_jd_start_line = None
-    class_found = False
-    method_found = False
-
-    # Walk through the nodes of the syntax tree
-    def walk(node, line_number):
-        nonlocal class_declaration, method_declaration, class_javadoc, method_javadoc, \
-            class_start_line, method_start_line, class_jd_start_line, method_jd_start_line, \
-            class_found, method_found
-        # Check if the node covers the line number
-        if node.start_point[0] <= line_number <= node.end_point[0]:
-            if node.type == 'class_declaration' and not class_found:
-                # Extract the class declaration (up to the opening brace)
-                class_declaration_node = node.child_by_field_name('name')
-                if class_declaration_node:
-                    class_found = True
-                    class_start_line, class_declaration = extract_class_declaration(source_code, node)
-                    result = find_javadoc(source_code, node)
-                    if result:
-                        class_jd_start_line, class_javadoc = result
-            elif node.type == 'method_declaration' and not method_found:
-                method_found = True
-                # Extract the method declaration (up to the opening brace)
-                method_start_line, method_declaration = extract_func(source_code, node)
-                result = find_javadoc(source_code, node)
-                if result:
-                    method_jd_start_line, method_javadoc = result
-            # Recursively check the children nodes
-            for child in node.children:
-                walk(child, line_number)
-
-    # Start walking the tree from the root
-    walk(root_node, line_number - 1)  # Convert to 0-based index
+
+    class_node, method_node = find_enclosing_nodes(parsed, line_number - 1)  # Convert to 0-based index
+    if class_node is not None:
+        # Extract the class declaration (up to the opening brace)
+        class_start_line, class_declaration = extract_class_declaration(parsed, class_node)
+        result = find_javadoc(parsed, class_node)
+        if result:
+            class_jd_start_line, class_javadoc = result
+    if method_node is not None:
+        # Extract the whole method
+        method_start_line, method_declaration = extract_func(parsed, method_node)
+        result = find_javadoc(parsed, method_node)
+        if result:
+            method_jd_start_line, method_javadoc = result
 
     class_details = {
         'start_line': class_jd_start_line if class_jd_start_line is not None else class_start_line,
+        'declaration_line': class_start_line,
         'content': format_output(class_declaration, class_javadoc),
     }
 
     method_details = {
         'start_line': method_jd_start_line if method_jd_start_line is not None else method_start_line,
+        'declaration_line': method_start_line,
         'content': format_output(method_declaration, method_javadoc),
     }
 
     return (class_details, method_details)
 
+def find_enclosing_nodes(parsed: ParsedSource, row: int) -> Tuple[Optional[Node], Optional[Node]]:
+    """
+    Finds the class and method declarations enclosing a line.
+
+    Descends straight to the smallest node at the first non-blank column of
+    the line (and, if no method is found, the last one) and walks up its
+    ancestors, so the cost is bounded by the tree
+    depth rather than the file size. The outermost matching ancestors are
+    returned. Lambdas are only used when no method or constructor encloses
+    the line, e.g. in field initializers.
+
+    Args:
+        parsed (ParsedSource): The parsed file.
+        row (int): The 0-based line number.
+
+    Returns:
+        Tuple[Optional[Node], Optional[Node]]: The class-like and method-like nodes.
+    """
+    if row < 0 or row >= len(parsed.line_offsets):
+        return None, None
+    line_start = parsed.line_offsets[row]
+    line_end = parsed.line_offsets[row + 1] if row + 1 < len(parsed.line_offsets) else len(parsed.source)
+    line = parsed.source[line_start:line_end]
+    first_column = len(line) - len(line.lstrip())
+    last_column = len(line.rstrip()) - 1
+    if last_column < first_column:
+        first_column = last_column = 0
+
+    root_node = parsed.tree.root_node
+    class_node, method_node = _enclosing_declarations(
+        root_node.descendant_for_point_range((row, first_column), (row, first_column)))
+    if method_node is None and last_column != first_column:
+        # A declaration may start later on the line, e.g. 'class A { void f() {'
+        _, method_node = _enclosing_declarations(
+            root_node.descendant_for_point_range((row, last_column), (row, last_column)))
+    return class_node, method_node
+
+def _enclosing_declarations(node: Optional[Node]) -> Tuple[Optional[Node], Optional[Node]]:
+    class_node = None
+    method_node = None
+    lambda_node = None
+    while node is not None:
+        if node.type in CLASS_NODE_TYPES:
+            class_node = node
+        elif node.type in METHOD_NODE_TYPES:
+            method_node = node
+        elif node.type == 'lambda_expression':
+            lambda_node = node
+        node = node.parent
+    return class_node, method_node if method_node is not None else lambda_node
+
+def node_text(parsed: ParsedSource, start_byte: int, end_byte: int) -> str:
+    """
+    Decodes a byte range of the source. Tree-sitter positions are UTF-8 byte
+    offsets, so slicing happens on the bytes and only the result is decoded.
+    """
+    return parsed.source[start_byte:end_byte].decode('utf-8', errors='replace').strip()
+
+def declaration_end(node: Node) -> int:
+    """Returns the byte offset just past the opening brace of a declaration's body, or its end if it has none"""
+    body = node.child_by_field_name('body')
+    if body is None or body.type == ';':
+        return node.end_byte
+    return body.start_byte + 1
+
 # Helper function to extract declaration up to the opening brace
-def extract_class_declaration(source_code, node) -> Tuple[int, str]:
-    start_byte = node.start_byte - 1
-    start_line = node.start_point[0] + 1
-    opening_brace_index = source_code.find('{', start_byte, node.end_byte) + 1
-    if opening_brace_index == -1:
-        # If there is no brace, just return the node content
-        return (start_line, source_code[start_byte:node.end_byte].strip())
-    return (start_line, source_code[start_byte:opening_brace_index].strip())
-
-def extract_func_declaration(source_code, node) -> Tuple[int, str]:
-    start_byte = node.start_byte - 1
+def extract_class_declaration(parsed: ParsedSource, node: Node) -> Tuple[int, str]:
     start_line = node.start_point[0] + 1
-    # Use regex to find the pattern ')\s*{' between the start and end bytes
-    pattern = r'\).*\{'
-    match = re.search(pattern, source_code[start_byte:node.end_byte])
-
-    if match:
-        # If the pattern is found, calculate the index at the end of the match
-        opening_brace_index = start_byte + match.end()
-        return (start_line, source_code[start_byte:opening_brace_index].strip())
-        # closing_parenthesis_index = start_byte + match.start() + 1
-        # return source_code[start_byte:closing_parenthesis_index].strip()
-
-    # If no match is found, just return the node content
-    return (start_line, source_code[start_byte:node.end_byte].strip())
-
-def extract_func(source_code, node) -> Tuple[int, str]:
-    func_str = source_code[node.start_byte-1:node.end_byte].strip()
+    return (start_line, node_text(parsed, node.start_byte, declaration_end(node)))
+
+def extract_func(parsed: ParsedSource, node: Node) -> Tuple[int, str]:
     start_line = node.start_point[0] + 1
     # Extract the entire function using the node's byte range
-    return (start_line, func_str)
+    return (start_line, node_text(parsed, node.start_byte, node.end_byte))
 
 # Helper function to find Javadocs before a class or method declaration
-def find_javadoc(source_code, node) -> Optional[Tuple[int, str]]:
+def find_javadoc(parsed: ParsedSource, node: Node) -> Optional[Tuple[int, str]]:
     # Get the line number right before the node's starting point
     node_start_line = node.start_point[0]
-    lines = source_code.splitlines()
 
     if node_start_line == 0:
         return None  # No lines before the first line
 
-    precending_line = lines[node_start_line - 1]
+    # Lines are read through the line offset table, so the cost is the length
+    # of the comment rather than the size of the file
+    precending_line = parsed.line(node_start_line - 1)
     if not precending_line.strip().endswith('*/'):
         return None  # No Javadoc comment before the node
 
@@ -114,13 +199,14 @@ def find_javadoc(source_code, node) -> Optional[Tuple[int, str]]:
     javadoc_lines = []
     start_line = -1
     for i in range(node_start_line - 1, -1, -1):
-        sline = lines[i].strip()
+        line = parsed.line(i)
+        sline = line.strip()
         if sline.startswith('/**'):
-            javadoc_lines.append(lines[i])
+            javadoc_lines.append(line)
             start_line = i + 1
             break
         elif sline.endswith('*/') or sline.endswith('**/') or sline.startswith('*'):
-            javadoc_lines.append(lines[i])
+            javadoc_lines.append(line)
         else:
             start_line = i + 1
             break
@@ -129,27 +215,137 @@ def find_javadoc(source_code, node) -> Optional[Tuple[int, str]]:
     # print(f"Javadoc_start_line: {start_line}")
     return (start_line, java_doc)
 
-def unindent(string: str) -> str:
-    lines = string.split('\n')
-    return '\n'.join(line.lstrip() for line in lines)
+# Classes (named after highlight.js ones) for nodes rendered as a single token
+TOKEN_CLASSES = {
+    'line_comment': 'hljs-comment',
+    'block_comment': 'hljs-comment',
+    'string_literal': 'hljs-string',
+    'character_literal': 'hljs-string',
+    'text_block': 'hljs-string',
+    'decimal_integer_literal': 'hljs-number',
+    'hex_integer_literal': 'hljs-number',
+    'octal_integer_literal': 'hljs-number',
+    'binary_integer_literal': 'hljs-number',
+    'decimal_floating_point_literal': 'hljs-number',
+    'hex_floating_point_literal': 'hljs-number',
+    'true': 'hljs-literal',
+    'false': 'hljs-literal',
+    'null_literal': 'hljs-literal',
+    'type_identifier': 'hljs-type',
+    'integral_type': 'hljs-type',
+    'floating_point_type': 'hljs-type',
+    'boolean_type': 'hljs-type',
+    'void_type': 'hljs-type',
+    'marker_annotation': 'hljs-meta',
+    'annotation': 'hljs-meta',
+}
+
+def _token_class(node: Node) -> Optional[str]:
+    token_class = TOKEN_CLASSES.get(node.type)
+    if token_class is not None:
+        return token_class
+    if not node.is_named and node.type.isalpha():
+        return 'hljs-keyword'
+    if node.type == 'identifier':
+        parent = node.parent
+        if parent is not None and parent.type in METHOD_NODE_TYPES:
+            name = parent.child_by_field_name('name')
+            if name is not None and name.start_byte == node.start_byte:
+                return 'hljs-title'
+    return None
 
-def match_indent(string: str) -> str:
-    lines = string.split('\n')
-    if len(lines) < 2:
-        return string
-    # extract the whitespace characters from the second line
-    whitespace = lines[1][:len(lines[1]) - len(lines[1].lstrip())]
-    fixed_first_line = whitespace + lines[0].lstrip()
-    return fixed_first_line + '\n' + '\n'.join(line for line in lines[1:])
+def iter_tokens(tree: Tree, start_byte: int, end_byte: int) -> Iterator[Tuple[int, int, str]]:
+    """
+    Yields the (start byte, end byte, class) of every highlighted token
+    overlapping a byte range, in source order. Subtrees outside the range are
+    skipped, so the cost follows the size of the range rather than the file.
+    """
+    cursor = tree.walk()
+    while True:
+        node = cursor.node
+        if node.start_byte >= end_byte:
+            # Everything after this sibling is out of range as well
+            if not _goto_next_in_parent(cursor):
+                return
+            continue
+        if node.end_byte > start_byte:
+            token_class = _token_class(node)
+            if token_class is not None:
+                yield node.start_byte, node.end_byte, token_class
+            elif cursor.goto_first_child_for_byte(start_byte) is not None:
+                continue
+        if not cursor.goto_next_sibling() and not _goto_next_in_parent(cursor):
+            return
+
+def _goto_next_in_parent(cursor) -> bool:
+    """Moves to the next sibling of the closest ancestor that has one"""
+    while cursor.goto_parent():
+        if cursor.goto_next_sibling():
+            return True
+    return False
+
+@timed('highlight')
+def highlight_rows(parsed: ParsedSource, first_row: int, last_row: int) -> List[str]:
+    """
+    Renders the 0-based rows first_row..last_row (inclusive) as syntax
+    highlighted HTML, one string per row, using the file's syntax tree.
+    """
+    last_row = min(last_row, len(parsed.line_offsets) - 1)
+    if first_row > last_row:
+        return []
+    start_byte = parsed.line_offsets[first_row]
+    end_byte = parsed.line_offsets[last_row + 1] - 1 if last_row + 1 < len(parsed.line_offsets) else len(parsed.source)
+
+    segments: List[Tuple[int, int, Optional[str]]] = []
+    position = start_byte
+    for token_start, token_end, token_class in iter_tokens(parsed.tree, start_byte, end_byte):
+        token_start = max(token_start, start_byte)
+        token_end = min(token_end, end_byte)
+        if token_start > position:
+            segments.append((position, token_start, None))
+        if token_end > token_start:
+            segments.append((token_start, token_end, token_class))
+        position = max(position, token_end)
+    if position < end_byte:
+        segments.append((position, end_byte, None))
+
+    # Tokens such as block comments can span rows, so split every segment at
+    # newlines and reopen its span on the next row
+    rows = ['']
+    for segment_start, segment_end, token_class in segments:
+        pieces = parsed.source[segment_start:segment_end].decode('utf-8', errors='replace').split('\n')
+        for i, piece in enumerate(pieces):
+            if i > 0:
+                rows.append('')
+            if piece:
+                escaped = html.escape(piece, quote=False)
+                rows[-1] += f'<span class="{token_class}">{escaped}</span>' if token_class else escaped
+    return rows
+
+def highlight_source(source_code: str) -> List[str]:
+    """Parses a standalone piece of Java code and highlights all of its rows"""
+    parsed = parse_source(source_code.encode())
+    return highlight_rows(parsed, 0, len(parsed.line_offsets) - 1)
+
+def highlight_snippet(java_file_path: str, details: dict) -> List[str]:
+    """Highlights the source rows a snippet returned by get_code_snippet covers"""
+    if details['start_line'] is None:
+        return []
+    parsed = get_parsed_source(java_file_path)
+    first_row = details['start_line'] - 1
+    return highlight_rows(parsed, first_row, first_row + details['content'].count('\n') - 1)
 
 def format_output(body: str, java_doc: Optional[str]) -> str:
     return f"{java_doc}\n{body}\n" if java_doc is not None else f"{body}\n"
 
 def get_code_snippet(java_file_path, line_number) -> Tuple[dict, dict]:
-    with open(java_file_path, 'r') as f:
-        source_code = f.read()
-
-    return find_class_declaration_and_method(source_code, line_number)
+    parsed = get_parsed_source(java_file_path)
+    details = parsed.snippets.get(line_number)
+    if details is None:
+        # Repeated frames in the same file and line share one result, which
+        # callers must not modify
+        details = parsed.snippets[line_number] = find_declarations(parsed, line_number)
+    return details
 
 # Example usage:
 if __name__ == '__main__':